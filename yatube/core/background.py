@@ -0,0 +1,39 @@
+"""Фоновые задачи в пуле потоков процесса."""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_WORKERS,
+            thread_name_prefix='background',
+        )
+    return _executor
+
+
+def run(func, *args):
+    """Выполняет задачу в потоке пула — со своим соединением с БД."""
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s упала', func.__name__)
+    finally:
+        connection.close()
+
+
+def submit(func, *args):
+    """Ставит func(*args) в пул; без воркеров — выполняет сразу."""
+    if settings.BACKGROUND_WORKERS:
+        get_executor().submit(run, func, *args)
+    else:
+        func(*args)
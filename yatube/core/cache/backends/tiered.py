@@ -0,0 +1,373 @@
+"""Двухуровневый кеш: LRU в памяти процесса перед общим SQLite-файлом.
+
+Общий уровень — файл LOCATION в режиме WAL, его делят все воркеры.
+Локальный уровень — LRU процесса с ограничением по числу записей и по
+байтам; запись живёт в нём не дольше LOCAL_TIMEOUT секунд и не дольше,
+чем в общем уровне.
+
+Каждая запись в общий уровень добавляет строку в журнал инвалидаций.
+Процессы читают журнал не чаще раза в POLL_INTERVAL секунд и выбрасывают
+из своего LRU изменённые другими ключи. Журнал хранится дольше
+LOCAL_TIMEOUT, поэтому процесс, который долго не читал его, ничего не
+пропускает: всё, что он мог закешировать до этого, уже истекло.
+
+Ключи с префиксами из LOCAL_EXCLUDE (счётчики) в LRU не попадают, и их
+изменения не попадают в журнал.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache '
+    '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE TABLE IF NOT EXISTS invalidations '
+    '(id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, '
+    'origin TEXT NOT NULL, created REAL NOT NULL)',
+)
+# Ключ в журнале, который сбрасывает весь LRU: make_key всегда добавляет
+# префикс, поэтому настоящий ключ так называться не может.
+CLEAR_ALL = '*'
+# Столько записей в общий уровень процесс делает между чистками.
+CULL_EVERY = 100
+# Ограничение SQLite на число параметров запроса.
+MAX_PARAMS = 500
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """LRU процесса: ключ → (срок, pickle), размер — сумма длин pickle."""
+
+    def __init__(self, max_entries, max_size):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.origin = f'{self.pid}:{id(self)}'
+        self.last_seen = None
+        self.last_sync = 0.0
+        self.writes = 0
+
+    def get(self, key, now):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= now:
+                self._pop(key)
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires):
+        with self.lock:
+            self._pop(key)
+            if len(value) > self.max_size:
+                return
+            self.data[key] = (expires, value)
+            self.size += len(value)
+            while (
+                len(self.data) > self.max_entries
+                or self.size > self.max_size
+            ):
+                _, (_, evicted) = self.data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def pop(self, *keys):
+        with self.lock:
+            for key in keys:
+                self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        item = self.data.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1])
+
+
+def get_tier(location, max_entries, max_size):
+    """LRU процесса для LOCATION; после fork — новый, пустой."""
+    with _tiers_lock:
+        tier = _tiers.get(location)
+        if tier is None or tier.pid != os.getpid():
+            tier = _tiers[location] = LocalTier(max_entries, max_size)
+        return tier
+
+
+def _chunks(items, size=MAX_PARAMS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self.local_max_size = options.get('LOCAL_MAX_SIZE', 16 * 1024 * 1024)
+        self.local_exclude = tuple(options.get('LOCAL_EXCLUDE', ()))
+        self.poll_interval = options.get('POLL_INTERVAL', 0.5)
+        self.log_timeout = max(
+            options.get('INVALIDATION_TIMEOUT', 300), 2 * self.local_timeout)
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # Django создаёт свой экземпляр кеша на поток, так что соединение
+        # тоже своё у каждого потока; после fork открываем новое.
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.location, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    @property
+    def tier(self):
+        return get_tier(
+            self.location, self.local_max_entries, self.local_max_size)
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def local(self, key):
+        return not key.startswith(self.local_exclude)
+
+    def local_expires(self, expires, now):
+        local = now + self.local_timeout
+        return local if expires is None else min(local, expires)
+
+    def sync(self, tier, now):
+        """Выбрасывает из LRU ключи, изменённые другими процессами.
+
+        Вызывается в начале каждой операции: первый вызов запоминает
+        конец журнала до того, как в LRU что-то попадёт.
+        """
+        if now - tier.last_sync < self.poll_interval:
+            return
+        tier.last_sync = now
+        if tier.last_seen is None:
+            tier.last_seen = self.connection.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM invalidations').fetchone()[0]
+            return
+        rows = self.connection.execute(
+            'SELECT id, key FROM invalidations WHERE id > ? AND origin != ?',
+            (tier.last_seen, tier.origin),
+        ).fetchall()
+        if not rows:
+            return
+        keys = [key for _, key in rows]
+        if CLEAR_ALL in keys:
+            tier.clear()
+        else:
+            tier.pop(*keys)
+        tier.last_seen = max(tier.last_seen, rows[-1][0])
+
+    def invalidate(self, connection, tier, keys, now):
+        connection.executemany(
+            'INSERT INTO invalidations (key, origin, created) '
+            'VALUES (?, ?, ?)',
+            [(key, tier.origin, now) for key in keys],
+        )
+        tier.writes += 1
+        if tier.writes >= CULL_EVERY:
+            tier.writes = 0
+            self.cull(connection, now)
+
+    def cull(self, connection, now):
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        connection.execute(
+            'DELETE FROM invalidations WHERE created < ?',
+            (now - self.log_timeout,))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency or 1,),
+            )
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        tier = self.tier
+        now = time.time()
+        self.sync(tier, now)
+        found = {}
+        missing = {}
+        for key in keys:
+            full_key = self.make_key(key, version=version)
+            self.validate_key(full_key)
+            value = tier.get(full_key, now) if self.local(key) else None
+            if value is None:
+                missing[full_key] = key
+            else:
+                found[key] = pickle.loads(value)
+        for chunk in _chunks(list(missing)):
+            rows = self.connection.execute(
+                'SELECT key, value, expires FROM cache WHERE key IN (%s) '
+                'AND (expires IS NULL OR expires > ?)'
+                % ', '.join('?' * len(chunk)),
+                (*chunk, now),
+            ).fetchall()
+            for full_key, value, expires in rows:
+                key = missing[full_key]
+                found[key] = pickle.loads(value)
+                if self.local(key):
+                    tier.set(
+                        full_key, value, self.local_expires(expires, now))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        tier = self.tier
+        now = time.time()
+        self.sync(tier, now)
+        expires = self.get_backend_timeout(timeout)
+        rows = []
+        for key, value in data.items():
+            full_key = self.make_key(key, version=version)
+            self.validate_key(full_key)
+            rows.append((
+                key, full_key, pickle.dumps(value, self.pickle_protocol)))
+        with self.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                [(full_key, value, expires) for _, full_key, value in rows],
+            )
+            self.invalidate(connection, tier, [
+                full_key for key, full_key, _ in rows if self.local(key)
+            ], now)
+        for key, full_key, value in rows:
+            if self.local(key) and (expires is None or expires > now):
+                tier.set(full_key, value, self.local_expires(expires, now))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        tier = self.tier
+        now = time.time()
+        self.sync(tier, now)
+        expires = self.get_backend_timeout(timeout)
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        value = pickle.dumps(value, self.pickle_protocol)
+        with self.transaction() as connection:
+            added = connection.execute(
+                'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+                'expires = excluded.expires WHERE cache.expires <= ?',
+                (full_key, value, expires, now),
+            ).rowcount > 0
+            if added and self.local(key):
+                self.invalidate(connection, tier, [full_key], now)
+        if added and self.local(key):
+            tier.set(full_key, value, self.local_expires(expires, now))
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        tier = self.tier
+        now = time.time()
+        self.sync(tier, now)
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        with self.transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (full_key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, self.pickle_protocol), full_key),
+            )
+            if self.local(key):
+                self.invalidate(connection, tier, [full_key], now)
+        tier.pop(full_key)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        tier = self.tier
+        now = time.time()
+        self.sync(tier, now)
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        with self.transaction() as connection:
+            touched = connection.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), full_key, now),
+            ).rowcount > 0
+            if touched and self.local(key):
+                self.invalidate(connection, tier, [full_key], now)
+        tier.pop(full_key)
+        return touched
+
+    def has_key(self, key, version=None):
+        return bool(self.get_many([key], version=version))
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        tier = self.tier
+        now = time.time()
+        self.sync(tier, now)
+        full_keys = []
+        for key in keys:
+            full_key = self.make_key(key, version=version)
+            self.validate_key(full_key)
+            full_keys.append(full_key)
+        with self.transaction() as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?',
+                [(full_key,) for full_key in full_keys])
+            self.invalidate(connection, tier, full_keys, now)
+        tier.pop(*full_keys)
+
+    def clear(self):
+        tier = self.tier
+        now = time.time()
+        self.sync(tier, now)
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM cache')
+            self.invalidate(connection, tier, [CLEAR_ALL], now)
+        tier.clear()
@@ -0,0 +1,33 @@
+"""Кеш фрагментов лент по версионированным ключам.
+
+View спрашивает готовый фрагмент до выборки страницы и на попадании её
+не делает, а тег versioned_cache берёт тот же ответ с запроса и второй
+раз в кеш не ходит.
+"""
+import hashlib
+
+from django.core.cache import cache
+
+from . import generations, metrics
+
+
+def cache_key(name, key):
+    digest = hashlib.md5(str(key).encode()).hexdigest()
+    return f'template.fragment:{name}:{digest}'
+
+
+def get(request, name, key):
+    """Готовый фрагмент или None; ключ None — фрагмент не кешируется."""
+    if key is None:
+        return None
+    memo = {} if request is None else request.__dict__.setdefault(
+        '_fragments', {})
+    full_key = cache_key(name, key)
+    if full_key not in memo:
+        memo[full_key] = cache.get(full_key)
+        metrics.record(name, hit=memo[full_key] is not None)
+    return memo[full_key]
+
+
+def store(name, key, value):
+    cache.set(cache_key(name, key), value, generations.fragment_timeout())
@@ -0,0 +1,57 @@
+"""Поколения кеша.
+
+Ключ фрагмента включает номера поколений данных, от которых он зависит.
+Сигналы увеличивают номер поколения — и старые фрагменты просто перестают
+находиться, удалять их по одному не нужно.
+"""
+from core.db import routers
+from django.conf import settings
+from django.core.cache import cache
+
+KEY = 'generation:{}'
+
+
+def get_generations(names):
+    keys = [KEY.format(name) for name in names]
+    found = cache.get_many(keys)
+    missing = {key: 1 for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(*names):
+    for name in names:
+        key = KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 2, timeout=None):
+                cache.incr(key)
+
+
+def page_cache_key(request, name, generations):
+    """Ключ страницы ленты: лента, страница или курсор, поколения и база.
+
+    None — кешировать нельзя: клиент закреплён за основной базой и должен
+    видеть свои изменения, а не фрагмент, собранный с реплики.
+    """
+    if routers.reading_pinned():
+        return None
+    page = request.GET.get('cursor') or request.GET.get('page') or ''
+    versions = '.'.join(map(str, get_generations(generations)))
+    return f'{name}:{page}:{versions}:{routers.read_source()}'
+
+
+def fragment_timeout():
+    """Время жизни фрагмента.
+
+    Собранный с реплики живёт не дольше её допустимого отставания: бамп
+    поколения мог прийти раньше, чем реплика догнала запись.
+    """
+    if routers.reading_replica():
+        return min(
+            settings.FRAGMENT_CACHE_TIMEOUT,
+            settings.DATABASE_REPLICA_PIN_SECONDS)
+    return settings.FRAGMENT_CACHE_TIMEOUT
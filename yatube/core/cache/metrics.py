@@ -0,0 +1,42 @@
+"""Счётчики попаданий и промахов кеша фрагментов.
+
+Хранятся в самом кеше, чтобы их видели все воркеры, которые его делят.
+"""
+from core import profiling
+from django.core.cache import cache
+
+NAMES_KEY = 'metrics:fragment_cache:names'
+COUNTER_KEY = 'metrics:fragment_cache:{}:{}'
+
+
+def _register(name):
+    names = cache.get(NAMES_KEY, set())
+    if name not in names:
+        cache.set(NAMES_KEY, names | {name}, timeout=None)
+
+
+def record(name, hit):
+    profiling.record_cache(hit)
+    key = COUNTER_KEY.format(name, 'hits' if hit else 'misses')
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счётчика ещё нет: первый раз или кеш очищен.
+        _register(name)
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def snapshot():
+    """{имя фрагмента: (попадания, промахи)}."""
+    names = sorted(cache.get(NAMES_KEY, set()))
+    keys = {
+        name: (COUNTER_KEY.format(name, 'hits'),
+               COUNTER_KEY.format(name, 'misses'))
+        for name in names
+    }
+    values = cache.get_many([key for pair in keys.values() for key in pair])
+    return {
+        name: (values.get(hits, 0), values.get(misses, 0))
+        for name, (hits, misses) in keys.items()
+    }
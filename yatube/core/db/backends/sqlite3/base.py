@@ -0,0 +1,78 @@
+"""SQLite для продакшена: WAL, прагмы и постоянные соединения.
+
+Прагмы выполняются при каждом новом соединении, их можно переопределить
+в OPTIONS['pragmas']. OPTIONS['transaction_mode'] = 'IMMEDIATE' берёт
+блокировку записи в начале atomic(): иначе транзакция, которая сначала
+читает, а потом пишет, при конкурентной записи сразу падает с «database
+is locked» — busy_timeout на повышение блокировки не действует.
+
+CONN_HEALTH_CHECKS (как в Django 4.1) проверяет переиспользуемое
+соединение перед первым запросом в каждом HTTP-запросе.
+"""
+from django.db.backends.sqlite3 import base
+
+Database = base.Database
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В WAL фиксация без fsync на каждую транзакцию не теряет целостность,
+    # только последние транзакции при отключении питания.
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # Отрицательный cache_size — в килобайтах: 64 МБ страниц на соединение.
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **kwargs.pop('pragmas', {})}
+        self.transaction_mode = kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        else:
+            super()._start_transaction_under_autocommit()
+
+    def is_usable(self):
+        try:
+            self.connection.execute('SELECT 1')
+        except Database.Error:
+            return False
+        return True
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and not self.health_check_done
+            and self.settings_dict.get('CONN_HEALTH_CHECKS')
+            and not self.in_atomic_block
+        ):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Вызывается в начале и в конце HTTP-запроса: следующий запрос
+        # снова проверит соединение перед первым обращением.
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
@@ -0,0 +1,38 @@
+"""Оценка числа строк без COUNT(*) — по статистике планировщика."""
+import json
+
+from django.db import DatabaseError, connections
+
+
+def estimate_count(queryset):
+    """Примерное число строк queryset или None, если оценки нет.
+
+    PostgreSQL отдаёт оценку планировщика для самого запроса. SQLite знает
+    только размер всей таблицы из sqlite_stat1 (заполняется ANALYZE) —
+    он годится лишь для запроса без WHERE: лента одной группы в большой
+    таблице иначе получила бы тысячи пустых страниц.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    if connection.vendor == 'sqlite':
+        if queryset.query.where:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+        except DatabaseError:
+            # ANALYZE ещё не запускали — таблицы sqlite_stat1 нет.
+            return None
+        return int(row[0].split()[0]) if row else None
+    return None
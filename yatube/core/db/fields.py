@@ -0,0 +1,17 @@
+from django.db import models
+
+
+class FullTextField(models.TextField):
+    """Текстовая колонка полнотекстового индекса: поддерживает __match."""
+
+
+@FullTextField.register_lookup
+class Match(models.Lookup):
+    """field__match=query — MATCH виртуальной таблицы SQLite FTS5."""
+
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
@@ -0,0 +1,121 @@
+"""Чтение с реплик (settings.DATABASE_REPLICAS) с read-your-writes.
+
+С реплик читают только view под декоратором replica_reads. Состояние
+запроса лежит в contextvar, его заводит ReplicaPinningMiddleware
+(core.middleware). Первая запись в запросе переводит оставшиеся чтения
+на основную базу, а middleware ставит клиенту подписанную куку на
+DATABASE_REPLICA_PIN_SECONDS: пока она жива, клиент читает только с
+основной базы и видит свои изменения, даже если реплика отстаёт.
+
+Версионированные кеши (фрагменты, число записей, ETag) помнят, с какой
+базы они собраны: отрисованное с отстающей реплики под свежим поколением
+не должно достаться закреплённому клиенту, а сам закреплённый клиент
+кеши фрагментов и ETag обходит.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_pinned'
+
+_current = ContextVar('db_routing', default=None)
+
+
+class Routing:
+    """Маршрутизация одного запроса."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica = False
+        self.wrote = False
+
+
+def is_pinned(request):
+    return request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=PIN_COOKIE,
+        max_age=settings.DATABASE_REPLICA_PIN_SECONDS) is not None
+
+
+def pin(response):
+    response.set_signed_cookie(
+        PIN_COOKIE, '1', salt=PIN_COOKIE,
+        max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+        httponly=True, samesite='Lax')
+
+
+def start(routing):
+    return _current.set(routing)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def reading_replica():
+    """True — чтения текущего запроса сейчас идут на реплику."""
+    routing = _current.get()
+    return bool(
+        settings.DATABASE_REPLICAS and routing is not None
+        and routing.replica and not routing.wrote
+    )
+
+
+def reading_pinned():
+    """True — текущий запрос от клиента, закреплённого за основной базой."""
+    routing = _current.get()
+    return routing is not None and (routing.pinned or routing.wrote)
+
+
+def read_source():
+    """Метка базы для ключей кеша: 'replica' или 'default'."""
+    return 'replica' if reading_replica() else DEFAULT_DB_ALIAS
+
+
+def replica_reads(view):
+    """Разрешает view читать с реплики, если клиент не закреплён."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        routing = _current.get()
+        if routing is None or routing.pinned:
+            return view(request, *args, **kwargs)
+        routing.replica = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            routing.replica = False
+    return wrapper
+
+
+class ReplicaRouter:
+    """Чтение — с реплики в replica_reads, всё остальное — с default.
+
+    Алиас возвращается явно: иначе Django пишет объект, прочитанный с
+    реплики, туда же, откуда он прочитан.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = _current.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между ними безопасны.
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема приезжает на реплики вместе с данными.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,173 @@
+"""Отдача файлов MEDIA_ROOT.
+
+Байты по возможности отдаёт фронтовый сервер: Django только проверяет
+доступ и ставит заголовки, а тело заменяет X-Accel-Redirect (nginx) или
+X-Sendfile (Apache, lighttpd). Без фронта файл отдаёт FileResponse:
+WSGI-сервер с wsgi.file_wrapper (gunicorn) шлёт его через sendfile() без
+копирования в Python, а Range и If-None-Match разбираются здесь.
+"""
+import mimetypes
+import os
+import re
+from stat import S_ISREG
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+# Имена из хешей содержимого — загрузки (posts.storage) и миниатюры sorl
+# (их имя — хеш имени исходника, который сам хеш, и опций) — не меняются.
+IMMUTABLE = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{32,64})\.\w+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def can_access(request, name):
+    """Публичны только каталоги MEDIA_PUBLIC_PREFIXES; остальное — staff.
+
+    Служебные файлы (точечные и недописанные .part) не отдаются никому.
+    """
+    basename = os.path.basename(name)
+    if not basename or basename.startswith('.') or name.endswith('.part'):
+        return False
+    if name.startswith(tuple(settings.MEDIA_PUBLIC_PREFIXES)):
+        return True
+    return request.user.is_staff
+
+
+def parse_range(header, size):
+    """(start, end) включительно из заголовка Range или None — весь файл.
+
+    Несколько диапазонов сразу не поддерживаются — тогда отдаётся весь
+    файл, как разрешает RFC 7233. ValueError — диапазон вне файла.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        # bytes=-N — последние N байт.
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRange:
+    """Кусок открытого файла для FileResponse.
+
+    read() не выходит за конец куска, а fileno() отдаёт дескриптор, так
+    что wsgi.file_wrapper может послать кусок через sendfile() — длину он
+    берёт из Content-Length, начало — из позиции в файле.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def cache_headers(name, stat):
+    """ETag, Last-Modified и Cache-Control для файла name."""
+    match = IMMUTABLE.search(name)
+    if match:
+        return {
+            'ETag': quote_etag(match.group(1)),
+            'Cache-Control':
+                f'public, max-age={IMMUTABLE_MAX_AGE}, immutable',
+        }
+    return {
+        'ETag': quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}'),
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}',
+    }
+
+
+def accel_response(name, path):
+    """Пустой ответ, тело которого подставит фронтовый сервер."""
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def file_response(request, path, size, etag):
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE', ''), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if byte_range and if_range and if_range != etag:
+        byte_range = None
+    start, end = byte_range or (0, size - 1)
+    file = open(path, 'rb')
+    response = FileResponse(FileRange(file, start, end - start + 1))
+    response.block_size = BLOCK_SIZE
+    response['Content-Length'] = end - start + 1
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def serve(request, name):
+    """Ответ с файлом name из MEDIA_ROOT; Http404 — нет файла или доступа."""
+    name = name.lstrip('/')
+    if not can_access(request, name):
+        raise Http404
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        stat = os.stat(path)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404
+    if not S_ISREG(stat.st_mode):
+        raise Http404
+    headers = cache_headers(name, stat)
+    last_modified = None
+    if 'Last-Modified' in headers:
+        last_modified = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=headers['ETag'], last_modified=last_modified)
+    if response is None:
+        if settings.MEDIA_SENDFILE:
+            response = accel_response(name, path)
+        else:
+            response = file_response(
+                request, path, stat.st_size, headers['ETag'])
+        content_type, encoding = mimetypes.guess_type(name)
+        if encoding or not content_type:
+            # .gz и прочее сжатое браузер не должен распаковывать сам.
+            content_type = 'application/octet-stream'
+        response['Content-Type'] = content_type
+    response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,98 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import profiling
+from .db import routers
+
+logger = logging.getLogger('core.profiling')
+
+
+class ProfilingMiddleware:
+    """Профиль каждого запроса в Server-Timing и в лог.
+
+    Включается настройкой PROFILING_ENABLED. Бюджет запросов view задаёт
+    декоратор profiling.query_budget, по умолчанию — PROFILING_QUERY_BUDGET;
+    превышение пишется в лог предупреждением.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = profiling.Profile()
+        token = profiling.start(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            profiling.stop(token)
+        profile.total_time = time.perf_counter() - start
+        match = request.resolver_match
+        if match is not None:
+            profile.view = match.view_name
+            profile.budget = getattr(
+                match.func, 'query_budget', settings.PROFILING_QUERY_BUDGET)
+        response['Server-Timing'] = self.server_timing(profile)
+        response.profile = profile
+        self.log(request, response, profile)
+        return response
+
+    def server_timing(self, profile):
+        data = profile.as_dict()
+        metrics = [
+            f'sql;dur={data["sql_ms"]};desc="{profile.queries} queries"',
+            f'tpl;dur={data["template_ms"]}',
+            f'cache;desc="hits={profile.cache_hits} '
+            f'misses={profile.cache_misses}"',
+            f'total;dur={data["total_ms"]}',
+        ]
+        if profile.over_budget:
+            metrics.append(
+                f'budget;desc="{profile.queries} > {profile.budget}"')
+        return ', '.join(metrics)
+
+    def log(self, request, response, profile):
+        data = profile.as_dict()
+        data.update(
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+        )
+        line = ' '.join(f'{key}={value}' for key, value in data.items())
+        if profile.over_budget:
+            logger.warning('over query budget %s', line, extra=data)
+        else:
+            logger.info('%s', line, extra=data)
+
+
+class ReplicaPinningMiddleware:
+    """Маршрутизация запроса по репликам (core.db.routers).
+
+    Закреплённый кукой клиент читает только с основной базы; запрос,
+    который что-то записал, закрепляет клиента заново.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing = routers.Routing(pinned=routers.is_pinned(request))
+        token = routers.start(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.stop(token)
+        if routing.wrote and settings.DATABASE_REPLICAS:
+            routers.pin(response)
+        return response
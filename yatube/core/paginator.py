@@ -0,0 +1,205 @@
+import base64
+import binascii
+import json
+import time
+
+from core import background
+from core.cache.generations import get_generations
+from core.db import routers
+from core.db.estimates import estimate_count
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+COUNT_KEY = 'paginator:count:{}'
+
+
+def refresh_count(object_list, key, versions):
+    """Точный COUNT(*) в кеш; вызывается в фоне или для малых списков."""
+    count = object_list.count()
+    refresh_at = time.time() + settings.PAGINATOR_COUNT_TIMEOUT
+    cache.set(key, (count, versions, refresh_at), timeout=None)
+    cache.delete(f'{key}:lock')
+    return count
+
+
+class WindowedPaginator(Paginator):
+    """Пагинатор со скользящим окном номеров и дешёвым числом записей.
+
+    Шаблону отдаётся page.window — только номера вокруг текущей страницы.
+    Число записей берётся из переданного count (денормализованный счётчик)
+    или из кеша по count_key: устаревшее значение отдаётся сразу, а точный
+    пересчёт уходит в фон. Пока в кеше пусто, используется оценка
+    планировщика; точный COUNT(*) делается в запросе только для списков
+    меньше PAGINATOR_EXACT_COUNT_THRESHOLD строк.
+    """
+
+    window = 2
+
+    def __init__(self, object_list, per_page, count=None, count_key=None,
+                 count_generations=(), **kwargs):
+        self._count = count
+        self.count_key = count_key
+        self.count_generations = count_generations
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        if self._count is not None:
+            return self._count
+        if self.count_key is None:
+            return super().count
+        # Число с отстающей реплики не должно попасть закреплённому клиенту.
+        key = COUNT_KEY.format(f'{self.count_key}:{routers.read_source()}')
+        versions = get_generations(self.count_generations)
+        threshold = settings.PAGINATOR_EXACT_COUNT_THRESHOLD
+        cached = cache.get(key)
+        if cached is not None:
+            count, cached_versions, refresh_at = cached
+            if cached_versions == versions and refresh_at > time.time():
+                return count
+            if count < threshold:
+                return refresh_count(self.object_list, key, versions)
+            self.schedule_refresh(key, versions)
+            return count
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < threshold:
+            return refresh_count(self.object_list, key, versions)
+        self.schedule_refresh(key, versions)
+        return estimate
+
+    def schedule_refresh(self, key, versions):
+        # Один пересчёт на ключ, сколько бы запросов ни пришло за это время.
+        if cache.add(f'{key}:lock', True, settings.PAGINATOR_COUNT_TIMEOUT):
+            background.submit(refresh_count, self.object_list, key, versions)
+
+    def get_window(self, number):
+        first = max(1, number - self.window)
+        last = min(self.num_pages, number + self.window)
+        return range(first, last + 1)
+
+    def page(self, number):
+        page = super().page(number)
+        page.window = self.get_window(page.number)
+        return page
+
+
+class CursorPaginator(WindowedPaginator):
+    """Пагинатор по ключу (keyset) без OFFSET и COUNT(*).
+
+    Страница адресуется непрозрачным курсором — закодированными значениями
+    полей сортировки крайней записи соседней страницы, поэтому любая
+    страница стоит столько же, сколько первая. Нумерованные страницы
+    (?page=N) по-прежнему работают через обычный Paginator.
+
+    transform получает список записей страницы и возвращает то, что
+    увидит шаблон: так можно листать по узкой таблице с нужным индексом,
+    а объекты для показа выбрать потом по ключу. Курсоры строятся по
+    исходным записям.
+    """
+
+    def __init__(self, object_list, per_page,
+                 ordering=('-pub_date', '-id'), transform=None, **kwargs):
+        self.ordering = ordering
+        self.fields = [field.lstrip('-') for field in ordering]
+        self.descending = ordering[0].startswith('-')
+        self.transform = transform
+        super().__init__(object_list.order_by(*ordering), per_page, **kwargs)
+
+    def _get_page(self, object_list, *args, **kwargs):
+        if self.transform is not None:
+            object_list = self.transform(list(object_list))
+        return super()._get_page(object_list, *args, **kwargs)
+
+    def encode_cursor(self, obj, direction):
+        values = [getattr(obj, field) for field in self.fields]
+        payload = json.dumps([direction, values], default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def get_field(self, name):
+        """Поле модели или аннотации, по которому идёт сортировка."""
+        annotations = self.object_list.query.annotations
+        if name in annotations:
+            return annotations[name].output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значения) или None для битого курсора.
+
+        Значения приводятся к типам полей сортировки: курсор приходит от
+        клиента и может быть подделан.
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded))
+            if (direction not in (FORWARD, BACKWARD)
+                    or not isinstance(values, list)
+                    or len(values) != len(self.fields)):
+                return None
+            values = [
+                self.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            return None
+        if None in values:
+            return None
+        return direction, values
+
+    def seek(self, values, forward):
+        """Условие «строго после/до записи с values» в порядке сортировки."""
+        lookup = 'lt' if self.descending == forward else 'gt'
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        # Избыточное условие на первое поле даёт индексу границу диапазона.
+        bound = Q(**{f'{self.fields[0]}__{lookup}e': values[0]})
+        return bound & condition
+
+    def get_cursor_page(self, cursor=None):
+        """Страница после/до курсора; без курсора — первая страница."""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        queryset = self.object_list
+        forward = True
+        if decoded is not None:
+            direction, values = decoded
+            forward = direction == FORWARD
+            queryset = queryset.filter(self.seek(values, forward))
+        if not forward:
+            queryset = queryset.reverse()
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if not forward:
+            items.reverse()
+        has_next = has_more if forward else True
+        has_previous = decoded is not None if forward else has_more
+        next_cursor = previous_cursor = None
+        if items and has_next:
+            next_cursor = self.encode_cursor(items[-1], FORWARD)
+        if items and has_previous:
+            previous_cursor = self.encode_cursor(items[0], BACKWARD)
+        page = self._get_page(items, 1, self)
+        page.is_cursor = True
+        page.next_cursor = next_cursor
+        page.previous_cursor = previous_cursor
+        return page
+
+
+def paginate(request, object_list, per_page=None, **kwargs):
+    """Страница ленты: ?page=N — по номеру, иначе — по курсору."""
+    paginator = CursorPaginator(
+        object_list, per_page or settings.PAGE_SIZE, **kwargs)
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        return paginator.get_page(page_number)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
@@ -0,0 +1,109 @@
+"""Профиль запроса: SQL, рендер шаблонов и кеш фрагментов.
+
+Профиль текущего запроса лежит в contextvar: его пополняют обёртка
+выполнения SQL, бэкенд шаблонов и счётчики кеша, а ProfilingMiddleware
+(core.middleware) отдаёт итог в Server-Timing и в лог.
+"""
+import time
+from contextvars import ContextVar
+
+from django.template.backends import django as django_backend
+
+_current = ContextVar('profile', default=None)
+
+
+class Profile:
+    def __init__(self, view=None, budget=None):
+        self.view = view
+        self.budget = budget
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.total_time = 0.0
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.queries > self.budget
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper: считает запросы и время."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            'view': self.view,
+            'queries': self.queries,
+            'query_budget': self.budget,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'total_ms': round(self.total_time * 1000, 2),
+        }
+
+
+def start(profile):
+    return _current.set(profile)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    """Профиль текущего запроса или None, если профилирование выключено."""
+    return _current.get()
+
+
+def record_cache(hit):
+    profile = current()
+    if profile is None:
+        return
+    if hit:
+        profile.cache_hits += 1
+    else:
+        profile.cache_misses += 1
+
+
+def query_budget(queries):
+    """Декоратор view: сколько SQL-запросов view может сделать за запрос."""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        profile = current()
+        if profile is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - start
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Бэкенд шаблонов Django, который засекает время рендера.
+
+    Засекается только шаблон, отрендеренный view: include и extends
+    рендерятся внутри него и второй раз не считаются.
+    """
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except django_backend.TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
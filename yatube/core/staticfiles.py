@@ -0,0 +1,163 @@
+"""Статика с хешами в именах и заранее сжатыми копиями.
+
+collectstatic кладёт файлы под именами с хешем содержимого (манифест
+Django), а рядом с текстовыми — .gz и, если установлен brotli, .br:
+сжатие на максимальном уровне делается один раз при сборке на всех
+ядрах, а не на каждый запрос. serve() отдаёт сжатую копию по
+Accept-Encoding.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from stat import S_ISREG
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from core import media
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = (
+    '.css', '.js', '.map', '.svg', '.txt', '.html', '.json', '.xml',
+    '.ico', '.ttf', '.otf', '.eot',
+)
+# Меньше — заголовки gzip съедят выигрыш.
+MIN_SIZE = 256
+# Копия, которая не меньше оригинала хотя бы на 5%, не нужна.
+MAX_RATIO = 0.95
+# Имя из манифеста: style.3f2a1b2c3d4e.css.
+HASHED = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def _gzip(data):
+    # mtime=0 — одинаковые файлы дают одинаковые .gz при каждой сборке.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+def compressors():
+    """Content-Encoding → (суффикс файла, функция), лучшее первым."""
+    found = {}
+    if brotli is not None:
+        found['br'] = ('.br', _brotli)
+    found['gzip'] = ('.gz', _gzip)
+    return found
+
+
+def compress(path):
+    """Пишет рядом с файлом path сжатые копии; возвращает их суффиксы."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    written = []
+    for suffix, func in compressors().values():
+        compressed = func(data)
+        if len(compressed) > len(data) * MAX_RATIO:
+            continue
+        with open(f'{path}{suffix}.tmp', 'wb') as file:
+            file.write(compressed)
+        os.replace(f'{path}{suffix}.tmp', f'{path}{suffix}')
+        written.append(suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Манифест с хешами и .gz/.br рядом с текстовыми файлами."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = sorted({
+            name for name in self.hashed_files.values()
+            if name.endswith(COMPRESSIBLE)
+            and self.size(name) >= MIN_SIZE
+        })
+        workers = settings.STATICFILES_COMPRESS_WORKERS or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                compress, [self.path(name) for name in names], chunksize=8)
+            for name, suffixes in zip(names, results):
+                if suffixes:
+                    yield name, ', '.join(name + s for s in suffixes), True
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding с q > 0."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def pick_encoding(request, name, path):
+    """(Content-Encoding или None, путь к файлу) под Accept-Encoding."""
+    if not name.endswith(COMPRESSIBLE):
+        return None, path
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for coding, (suffix, _) in compressors().items():
+        if (coding in accepted or '*' in accepted) and os.path.exists(
+                path + suffix):
+            return coding, path + suffix
+    return None, path
+
+
+def serve(request, name):
+    """Файл name из STATIC_ROOT; сжатая копия — если клиент её примет."""
+    try:
+        path = safe_join(settings.STATIC_ROOT, name)
+        stat = os.stat(path)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404
+    # Сжатые копии отдаются только вместо оригинала.
+    if not S_ISREG(stat.st_mode) or name.endswith(('.gz', '.br', '.tmp')):
+        raise Http404
+    encoding, path = pick_encoding(request, name, path)
+    if encoding:
+        stat = os.stat(path)
+    etag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}-{encoding or "identity"}'
+    headers = {'ETag': quote_etag(etag)}
+    if HASHED.search(name):
+        headers['Cache-Control'] = (
+            f'public, max-age={IMMUTABLE_MAX_AGE}, immutable')
+    else:
+        headers['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        headers['Last-Modified'] = http_date(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=headers['ETag'], last_modified=int(stat.st_mtime))
+    if response is None:
+        response = media.file_response(
+            request, path, stat.st_size, headers['ETag'])
+        content_type, _ = mimetypes.guess_type(name)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        if encoding:
+            response['Content-Encoding'] = encoding
+    if name.endswith(COMPRESSIBLE):
+        patch_vary_headers(response, ('Accept-Encoding',))
+    response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    return response
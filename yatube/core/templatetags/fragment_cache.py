@@ -0,0 +1,44 @@
+from core.cache import fragments
+from django import template
+
+register = template.Library()
+
+
+class VersionedCacheNode(template.Node):
+    def __init__(self, nodelist, name, key):
+        self.nodelist = nodelist
+        self.name = name
+        self.key = key
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        key = self.key.resolve(context)
+        value = fragments.get(context.get('request'), name, key)
+        if value is None:
+            value = self.nodelist.render(context)
+            if key is not None:
+                fragments.store(name, key, value)
+        return value
+
+
+@register.tag
+def versioned_cache(parser, token):
+    """{% versioned_cache name key %}...{% endversioned_cache %}
+
+    Кеширует фрагмент по готовому версионированному ключу (см.
+    core.cache.generations.page_cache_key) и считает попадания; с ключом
+    None фрагмент рендерится без кеша. View, который заранее проверил
+    фрагмент через core.cache.fragments.get, на попадании может не
+    передавать данные для тела.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' принимает два аргумента: имя фрагмента и ключ.")
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    return VersionedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+    )
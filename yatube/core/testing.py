@@ -0,0 +1,31 @@
+from django.urls import URLPattern
+
+
+class QueryBudgetMixin:
+    """Проверки бюджетов SQL-запросов view для TestCase.
+
+    Нужен включённый ProfilingMiddleware (PROFILING_ENABLED = True):
+    он кладёт профиль запроса в response.profile.
+    """
+
+    def assertWithinQueryBudget(self, response):
+        profile = getattr(response, 'profile', None)
+        if profile is None:
+            self.fail('Нет response.profile: включите PROFILING_ENABLED.')
+        self.assertIsNotNone(
+            profile.budget,
+            f'У {profile.view} не объявлен бюджет запросов (query_budget).')
+        self.assertLessEqual(
+            profile.queries, profile.budget,
+            f'{profile.view}: {profile.queries} запросов '
+            f'при бюджете {profile.budget}.')
+
+    def assertAllViewsChecked(self, urlpatterns, checked):
+        """Каждый маршрут urlpatterns есть среди проверенных имён."""
+        names = {
+            pattern.name for pattern in urlpatterns
+            if isinstance(pattern, URLPattern)
+        }
+        self.assertEqual(
+            names - set(checked), set(),
+            'Маршруты без проверки бюджета запросов.')
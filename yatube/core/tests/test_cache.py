@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import tempfile
+
+from core.cache.backends import tiered
+from django.test import SimpleTestCase
+
+
+def tiered_cache(location, **options):
+    return tiered.TieredCache(
+        location, {'OPTIONS': {'POLL_INTERVAL': 0, **options}})
+
+
+def change_in_other_process(location, method, *args):
+    """Цель для процесса-«воркера»: своё соединение и свой LRU."""
+    getattr(tiered_cache(location), method)(*args)
+
+
+class TieredCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, 'cache.sqlite3')
+        self.cache = tiered_cache(self.location, LOCAL_MAX_ENTRIES=3)
+
+    def tearDown(self):
+        for location in (self.location, f'{self.location}.small'):
+            tiered._tiers.pop(location, None)
+        self.directory.cleanup()
+
+    def in_other_process(self, method, *args, processes=1):
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(
+                target=change_in_other_process,
+                args=(self.location, method, *args))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+    def local_keys(self):
+        return [key.split(':', 2)[2] for key in self.cache.tier.data]
+
+    def test_local_lru(self):
+        """LRU процесса ограничен числом записей и размером."""
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.cache.get('a')
+        self.cache.set('d', 4)
+        self.assertEqual(self.local_keys(), ['c', 'a', 'd'])
+        self.assertEqual(self.cache.get('b'), 2)
+        self.assertEqual(self.local_keys(), ['a', 'd', 'b'])
+        small = tiered_cache(f'{self.location}.small', LOCAL_MAX_SIZE=100)
+        small.set('big', 'x' * 200)
+        self.assertEqual(small.get('big'), 'x' * 200)
+        self.assertNotIn(':1:big', small.tier.data)
+
+    def test_get_many_single_query(self):
+        """get_many читает промахи LRU из общего уровня одним запросом."""
+        self.cache.set_many({f'key{i}': i for i in range(10)}, timeout=None)
+        self.cache.tier.clear()
+        statements = []
+        self.cache.connection.set_trace_callback(statements.append)
+        found = self.cache.get_many([f'key{i}' for i in range(11)])
+        self.assertEqual(found, {f'key{i}': i for i in range(10)})
+        self.assertEqual(
+            len([sql for sql in statements if 'FROM cache' in sql]), 1)
+
+    def test_timeouts(self):
+        self.cache.set('short', 1, timeout=0)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 2))
+        self.assertFalse(self.cache.add('short', 3))
+        self.assertEqual(self.cache.get('short'), 2)
+
+    def test_invalidation_across_processes(self):
+        """Изменения из другого процесса вытесняют локальные копии."""
+        self.cache.set_many({'changed': 1, 'deleted': 1})
+        self.assertEqual(self.cache.get('changed'), 1)
+        self.in_other_process('set', 'changed', 2)
+        self.in_other_process('delete', 'deleted')
+        self.assertEqual(
+            self.cache.get_many(['changed', 'deleted']), {'changed': 2})
+        self.in_other_process('clear')
+        self.assertIsNone(self.cache.get('changed'))
+
+    def test_incr_across_processes(self):
+        """incr атомарен между процессами."""
+        self.cache.set('counter', 0, timeout=None)
+        self.in_other_process('incr', 'counter', processes=4)
+        self.assertEqual(self.cache.get('counter'), 4)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import tempfile
+
+from core.db.backends.sqlite3.base import DatabaseWrapper
+from django.db import connection
+from django.test import TestCase
+
+
+class SQLiteBackendTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'backend.sqlite3')
+        self.wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': self.path,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        }, alias='backend_test')
+
+    def tearDown(self):
+        self.wrapper.close()
+        self.directory.cleanup()
+
+    def pragma(self, name):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        """Новое соединение включает WAL и прагмы."""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -64 * 1024)
+
+    def test_immediate_transaction(self):
+        """atomic() сразу берёт блокировку записи."""
+        self.wrapper.ensure_connection()
+        other = sqlite3.connect(self.path, timeout=0)
+        try:
+            self.wrapper._start_transaction_under_autocommit()
+            with self.assertRaisesMessage(
+                    sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+            self.wrapper.connection.rollback()
+        finally:
+            other.close()
+
+    def test_health_check(self):
+        """Перед запросом переиспользуемое соединение проверяется."""
+        self.wrapper.ensure_connection()
+        self.wrapper.connection.close()
+        self.wrapper.close_if_unusable_or_obsolete()
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from posts.models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+
+def get_image_content(size=(50, 50), ext='png'):
+    content = BytesIO()
+    Image.new('RGB', size, color=(255, 0, 0)).save(content, ext)
+    return content.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaServingTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Viewer')
+        self.content = get_image_content()
+        self.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                'photo.png', self.content, content_type='image/png'),
+        )
+        self.url = settings.MEDIA_URL + self.post.image.name
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, **headers)
+        if response.streaming:
+            response.body = b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    def save_plain(self, name, content=b'0123456789'):
+        storage = Post._meta.get_field('image').storage
+        storage.delete(name)
+        FileSystemStorage._save(storage, name, ContentFile(content))
+        return settings.MEDIA_URL + name
+
+    def test_hashed_file_immutable(self):
+        """Файл с хешем в имени кешируется навсегда и отдаётся целиком."""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertNotIn('Last-Modified', response)
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_plain_file_revalidated(self):
+        """Файл без хеша кешируется ненадолго, с Last-Modified."""
+        url = self.save_plain('posts/plain.txt')
+        response = self.get(url)
+        self.assertEqual(response.body, b'0123456789')
+        self.assertEqual(
+            response['Cache-Control'],
+            f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+        self.assertEqual(
+            self.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            304)
+        self.assertEqual(
+            self.get(url, HTTP_IF_MODIFIED_SINCE=response[
+                'Last-Modified']).status_code,
+            304)
+
+    def test_ranges(self):
+        """Range отдаёт кусок файла с 206, вне файла — 416."""
+        url = self.save_plain('posts/range.bin')
+        cases = {
+            'bytes=2-5': (206, b'2345', 'bytes 2-5/10'),
+            'bytes=7-': (206, b'789', 'bytes 7-9/10'),
+            'bytes=-3': (206, b'789', 'bytes 7-9/10'),
+            'bytes=8-100': (206, b'89', 'bytes 8-9/10'),
+            'bytes=0-1,4-5': (200, b'0123456789', None),
+            'bytes=10-': (416, b'', 'bytes */10'),
+        }
+        for header, (status, body, content_range) in cases.items():
+            with self.subTest(range=header):
+                response = self.get(url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status)
+                if status != 416:
+                    self.assertEqual(response.body, body)
+                    self.assertEqual(
+                        response['Content-Length'], str(len(body)))
+                self.assertEqual(response.get('Content-Range'), content_range)
+
+    def test_if_range(self):
+        """Устаревший If-Range отменяет Range: файл отдаётся целиком."""
+        etag = self.get()['ETag']
+        response = self.get(HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, self.content[:4])
+        response = self.get(HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.content)
+
+    def test_front_server_headers(self):
+        """С фронтовым сервером Django отдаёт только заголовки."""
+        name = self.post.image.name
+        with self.settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.get()
+        self.assertEqual(response.content, b'')
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + name)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        with self.settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.get()
+        self.assertEqual(
+            response['X-Sendfile'], os.path.join(TEMP_MEDIA_ROOT, name))
+
+    def test_access(self):
+        """Вне публичных каталогов — только staff; служебное — никому."""
+        private = self.save_plain('exports/report.csv')
+        hidden = self.save_plain('posts/upload.part')
+        for url in (
+            private,
+            hidden,
+            settings.MEDIA_URL + 'posts/missing.png',
+            settings.MEDIA_URL + 'posts/../../yatube/settings.py',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url).status_code, 404)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.get(private).status_code, 200)
+        self.assertEqual(self.get(hidden).status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
@@ -0,0 +1,119 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import skipUnless
+
+from core import staticfiles
+from django.conf import settings
+from django.core.management import call_command
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from PIL import Image
+
+
+def get_image_content(size=(50, 50), ext='png'):
+    content = BytesIO()
+    Image.new('RGB', size, color=(255, 0, 0)).save(content, ext)
+    return content.getvalue()
+
+
+class StaticFilesTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.source = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        os.makedirs(os.path.join(cls.source, 'css'))
+        cls.css = b'body { color: red; }\n' * 100
+        with open(os.path.join(cls.source, 'css', 'site.css'), 'wb') as file:
+            file.write(cls.css)
+        with open(os.path.join(cls.source, 'logo.png'), 'wb') as file:
+            file.write(get_image_content())
+        cls.settings = override_settings(
+            STATICFILES_DIRS=[cls.source],
+            STATIC_ROOT=cls.root,
+            STATICFILES_STORAGE=(
+                'core.staticfiles.CompressedManifestStaticFilesStorage'),
+            STATICFILES_COMPRESS_WORKERS=2,
+        )
+        cls.settings.enable()
+        call_command(
+            'collectstatic', interactive=False, verbosity=0,
+            ignore_patterns=['admin'])
+        with open(os.path.join(cls.root, 'staticfiles.json')) as file:
+            cls.manifest = json.load(file)['paths']
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        shutil.rmtree(cls.source, ignore_errors=True)
+        shutil.rmtree(cls.root, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, name, **headers):
+        response = self.client.get(settings.STATIC_URL + name, **headers)
+        if response.streaming:
+            response.body = b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    def test_collectstatic_writes_hashed_compressed_files(self):
+        """Текстовые файлы получают хеш в имени и сжатую копию рядом."""
+        css = self.manifest['css/site.css']
+        self.assertRegex(css, r'^css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root, css + '.gz'), 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), self.css)
+        logo = os.path.join(self.root, self.manifest['logo.png'])
+        self.assertFalse(os.path.exists(logo + '.gz'))
+        self.assertFalse(os.path.exists(logo + '.br'))
+
+    def test_serving_picks_encoding(self):
+        """Сжатая копия отдаётся только тем, кто её принимает."""
+        name = self.manifest['css/site.css']
+        response = self.get(name, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(gzip.decompress(response.body), self.css)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        for accept in ('', 'identity', 'gzip;q=0'):
+            with self.subTest(accept=accept):
+                response = self.get(name, HTTP_ACCEPT_ENCODING=accept)
+                self.assertNotIn('Content-Encoding', response)
+                self.assertEqual(response.body, self.css)
+
+    def test_conditional(self):
+        """ETag у сжатой копии свой; имя без хеша перепроверяется."""
+        name = self.manifest['css/site.css']
+        etag = self.get(name, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertNotEqual(self.get(name)['ETag'], etag)
+        response = self.get(
+            name, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.get('css/site.css')
+        self.assertEqual(
+            response['Cache-Control'], 'public, max-age=0, must-revalidate')
+        self.assertEqual(
+            self.get(
+                'css/site.css',
+                HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            304)
+
+    def test_compressed_copies_not_served_directly(self):
+        """Файлы .gz и пути вне STATIC_ROOT не отдаются."""
+        name = self.manifest['css/site.css']
+        request = RequestFactory().get('/')
+        for path in (name + '.gz', '../manage.py', 'css'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    staticfiles.serve(request, path)
+
+    @skipUnless(staticfiles.brotli, 'brotli не установлен')
+    def test_brotli_preferred(self):
+        """С brotli .br предпочтительнее .gz."""
+        response = self.get(
+            self.manifest['css/site.css'], HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+
+
+@contextmanager
+def keep_auto_now(model, *field_names):
+    """Временно отключает auto_now/auto_now_add у полей модели.
+
+    Нужно для бэкфилла: bulk_create и save() иначе перезапишут
+    переданные даты текущим временем.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def chunks(queryset, size):
+    """Пачки первичных ключей по возрастанию, без OFFSET."""
+    last = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last).order_by('pk').values_list(
+            'pk', flat=True)[:size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
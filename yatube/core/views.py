@@ -1,4 +1,10 @@
+from core import media as media_files
+from core import staticfiles
+from core.cache.metrics import snapshot as metrics_snapshot
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_safe
 
 
 def page_not_found(request, exception):
@@ -17,3 +23,33 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """Счётчики кеша фрагментов в текстовом формате Prometheus."""
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise Http404
+    lines = [
+        '# TYPE yatube_fragment_cache_hits_total counter',
+        '# TYPE yatube_fragment_cache_misses_total counter',
+    ]
+    for name, (hits, misses) in metrics_snapshot().items():
+        lines.append(
+            f'yatube_fragment_cache_hits_total{{fragment="{name}"}} {hits}')
+        lines.append(
+            f'yatube_fragment_cache_misses_total{{fragment="{name}"}} '
+            f'{misses}')
+    return HttpResponse(
+        '\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
+
+
+@require_safe
+def media(request, path):
+    """Файл MEDIA_ROOT: через фронтовый сервер или FileResponse."""
+    return media_files.serve(request, path)
+
+
+@require_safe
+def static(request, path):
+    """Собранная статика из STATIC_ROOT, по возможности сжатая."""
+    return staticfiles.serve(request, path)
@@ -0,0 +1,113 @@
+"""Валидаторы условного GET (ETag и Last-Modified) для лент и постов.
+
+Валидаторы считаются до view одним запросом метаданных и поколениями
+кеша, поэтому на 304 не тратятся ни выборка постов, ни рендер шаблона.
+Last-Modified — самое позднее изменение поста (или комментария на его
+странице); ETag дополнительно включает поколения данных страницы, номер
+страницы и пользователя: шапка и кнопка подписки у каждого свои. Удаление
+поста не сдвигает Last-Modified, но меняет поколение, а If-None-Match
+проверяется раньше If-Modified-Since. ETag помнит базу, с которой
+собрана страница, а закреплённый за основной базой клиент валидаторов не
+получает вовсе: 304 на копию с отстающей реплики скрыл бы его запись.
+"""
+import hashlib
+
+from core.cache.generations import get_generations
+from core.db import routers
+from django.contrib.auth import get_user_model
+from django.db.models import Max, OuterRef, Subquery
+from django.views.decorators.http import condition
+
+from .models import Group, Post
+
+User = get_user_model()
+
+
+def validators(func):
+    """Декоратор view с условным GET из func(request, ...).
+
+    func возвращает (поколения, last_modified, *прочее для ETag).
+    condition() спрашивает ETag и Last-Modified по отдельности, поэтому
+    результат func запоминается на запросе.
+    """
+    def get(request, *args, **kwargs):
+        if not hasattr(request, '_validators'):
+            request._validators = func(request, *args, **kwargs)
+        return request._validators
+
+    def etag(request, *args, **kwargs):
+        if routers.reading_pinned():
+            return None
+        names, *rest = get(request, *args, **kwargs)
+        page = request.GET.get('cursor') or request.GET.get('page') or ''
+        versions = '.'.join(map(str, get_generations(names)))
+        raw = ':'.join(map(str, (
+            request.user.pk, page, versions, routers.read_source(), *rest)))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if routers.reading_pinned():
+            return None
+        return get(request, *args, **kwargs)[1]
+
+    def decorator(view):
+        return condition(etag_func=etag, last_modified_func=last_modified)(
+            view)
+    return decorator
+
+
+def _following(request):
+    if request.user.is_authenticated:
+        return (f'follow:{request.user.id}',)
+    return ()
+
+
+@validators
+def index(request):
+    last = Post.objects.aggregate(last=Max('updated'))['last']
+    return ('index', 'groups'), last
+
+
+def _last_updated(field):
+    """Дата последнего изменения постов группы или автора.
+
+    ORDER BY ... LIMIT 1 — один шаг по индексу (field, -updated) вместо
+    MAX() по всем постам.
+    """
+    return Subquery(Post.objects.filter(**{field: OuterRef('pk')}).order_by(
+        '-updated').values('updated')[:1])
+
+
+@validators
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).annotate(
+        last=_last_updated('group')).values_list('id', 'last').first()
+    if group is None:
+        return (), None
+    group_id, last = group
+    return (f'group:{group_id}', 'groups'), last
+
+
+@validators
+def profile(request, username):
+    author = User.objects.filter(username=username).annotate(
+        last=_last_updated('author')).values_list('id', 'last').first()
+    if author is None:
+        return (), None
+    author_id, last = author
+    return (f'profile:{author_id}', 'groups') + _following(request), last
+
+
+@validators
+def post_detail(request, post_id):
+    post = Post.objects.filter(id=post_id).order_by().values('id').annotate(
+        last_comment=Max('comments__created'),
+    ).values_list(
+        'author_id', 'updated', 'comment_count', 'last_comment').first()
+    if post is None:
+        return (), None
+    author_id, updated, comment_count, last_comment = post
+    last = max(filter(None, (updated, last_comment)))
+    # Счётчик комментариев ловит удаление комментария, поколение профиля —
+    # новые посты автора (их число есть на странице) и готовую миниатюру.
+    return (f'profile:{author_id}', 'groups'), last, comment_count
@@ -0,0 +1,78 @@
+"""Денормализованные счётчики постов, комментариев и подписок."""
+import threading
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, User, UserStats
+
+# Пользователи, которых сейчас удаляют каскадом в этом потоке: их сигналы
+# удаления постов и подписок не должны заново создавать UserStats.
+_deleting = threading.local()
+
+
+def _count(queryset, field):
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def user_counts():
+    """Выражения точных значений счётчиков UserStats (pk = user_id)."""
+    return {
+        'posts_count': _count(Post.objects.all(), 'author'),
+        'comments_count': _count(Comment.objects.all(), 'author'),
+        'followers_count': _count(Follow.objects.all(), 'author'),
+        'following_count': _count(Follow.objects.all(), 'user'),
+    }
+
+
+def deleting_users():
+    if not hasattr(_deleting, 'ids'):
+        _deleting.ids = set()
+    return _deleting.ids
+
+
+def recount_users(user_ids):
+    """Пересчитывает счётчики пользователей одним UPDATE.
+
+    Строки создаются только для существующих пользователей, которых не
+    удаляют прямо сейчас.
+    """
+    user_ids = set(user_ids) - deleting_users()
+    existing = User.objects.filter(id__in=user_ids).values_list(
+        'id', flat=True)
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id) for user_id in existing],
+        ignore_conflicts=True,
+    )
+    return UserStats.objects.filter(user_id__in=user_ids).update(
+        **user_counts())
+
+
+def recount_posts(post_ids):
+    return Post.objects.filter(id__in=post_ids).update(
+        comment_count=_count(Comment.objects.all(), 'post'))
+
+
+def _shift(field, delta):
+    # Разошедшийся счётчик не уходит ниже нуля — иначе CHECK в БД.
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def change_user(user_id, **deltas):
+    """Атомарно сдвигает счётчики: change_user(1, posts_count=1)."""
+    if user_id in deleting_users():
+        return
+    updates = {field: _shift(field, delta) for field, delta in deltas.items()}
+    if not UserStats.objects.filter(user_id=user_id).update(**updates):
+        # Строки ещё нет (например, пользователь создан через bulk_create):
+        # создаём её сразу с точными значениями.
+        recount_users([user_id])
+
+
+def change_post(post_id, delta):
+    Post.objects.filter(id=post_id).update(
+        comment_count=_shift('comment_count', delta))
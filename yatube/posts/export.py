@@ -0,0 +1,124 @@
+"""Потоковая выгрузка постов в JSONL или CSV, по желанию — в gzip или zip.
+
+Все функции — генераторы байтовых кусков: посты читаются из БД пачками
+через iterator(), а сжатие и архив собираются на лету, поэтому память
+не зависит от числа постов и размера картинок.
+"""
+import csv
+import json
+import zipfile
+import zlib
+
+FIELDS = ('id', 'text', 'pub_date', 'author', 'group', 'image')
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CHUNK_SIZE = 2000
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def rows(posts, chunk_size=CHUNK_SIZE):
+    """Кортежи FIELDS постов queryset пачками по chunk_size."""
+    return posts.order_by('id').values_list(
+        'id', 'text', 'pub_date', 'author__username', 'group__slug', 'image',
+    ).iterator(chunk_size=chunk_size)
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        record = dict(zip(FIELDS, row))
+        record['pub_date'] = record['pub_date'].isoformat()
+        yield (json.dumps(record, ensure_ascii=False) + '\n').encode()
+
+
+class _Line:
+    """Псевдофайл для csv.writer: write() возвращает строку, а не пишет."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(FIELDS).encode()
+    for row in rows:
+        record = list(row)
+        record[2] = record[2].isoformat()
+        yield writer.writerow(record).encode()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class _Sink:
+    """Несматываемый файл для ZipFile: копит байты до следующего drain()."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def zip_chunks(name, chunks, images, storage):
+    """Zip-поток: файл name из chunks и картинки images из storage.
+
+    ZipFile на несматываемом файле пишет размеры после данных, поэтому
+    архив отдаётся по мере записи, а не после неё.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(name, 'w') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                yield sink.drain()
+        for image in images:
+            if not storage.exists(image):
+                continue
+            info = zipfile.ZipInfo(image)
+            # Картинки уже сжаты — кладём как есть.
+            info.compress_type = zipfile.ZIP_STORED
+            with storage.open(image) as source, \
+                    archive.open(info, 'w') as file:
+                for chunk in source.chunks(FILE_CHUNK_SIZE):
+                    file.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()
+
+
+def export(posts, fmt, compress=False, images=False, storage=None,
+           name='posts'):
+    """Куски выгрузки и имя файла для неё.
+
+    С images картинки постов и сами посты собираются в zip (он и так
+    сжат, поэтому compress тогда не нужен).
+    """
+    lines = jsonl_lines if fmt == 'jsonl' else csv_lines
+    chunks = lines(rows(posts))
+    filename = f'{name}.{fmt}'
+    if images:
+        image_names = posts.exclude(image='').order_by('id').values_list(
+            'image', flat=True).iterator(chunk_size=CHUNK_SIZE)
+        return (
+            zip_chunks(filename, chunks, image_names, storage),
+            f'{name}.zip',
+        )
+    if compress:
+        return gzip_chunks(chunks), f'{filename}.gz'
+    return chunks, filename
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Comment, Post
 
 
@@ -8,6 +10,14 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        # Новую загрузку ужимаем и перекодируем до того, как ImageField
+        # прочитает из неё размеры.
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return images.process(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
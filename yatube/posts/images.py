@@ -0,0 +1,123 @@
+"""Обработка картинок постов при загрузке.
+
+Картинка декодируется один раз и сразу уменьшенной (draft mode JPEG
+декодирует в 1/2–1/8 размера), поворачивается по EXIF, ужимается до
+IMAGE_MAX_SIDE по длинной стороне и перекодируется без метаданных. Всё
+остальное — размеры в width_field/height_field, миниатюры, WebP — дальше
+работает с небольшим файлом.
+"""
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps, features
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'GIF': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+EXTENSIONS = {
+    'JPEG': ('.jpg', '.jpeg'),
+    'PNG': ('.png',),
+    'GIF': ('.gif',),
+    'WEBP': ('.webp',),
+}
+
+
+def target_size(size, max_side):
+    """Размер после ужатия до max_side по длинной стороне."""
+    width, height = size
+    scale = min(1, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def open_image(file):
+    """Открывает картинку и проверяет её по заголовку, не декодируя."""
+    if file.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)d МБ.',
+            params={'limit': settings.IMAGE_MAX_UPLOAD_SIZE // 2 ** 20},
+            code='file_too_large')
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError(
+            'Не удалось прочитать картинку.', code='invalid_image')
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка больше %(limit)d мегапикселей.',
+            params={'limit': settings.IMAGE_MAX_PIXELS // 10 ** 6},
+            code='too_many_pixels')
+    return image
+
+
+def process(upload):
+    """Обработанная копия загруженной картинки — File для ImageField.
+
+    Анимацию перекодирование потеряло бы, поэтому она только
+    проверяется и сохраняется как есть.
+    """
+    image = open_image(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload
+    max_side = settings.IMAGE_MAX_SIDE
+    fmt = image.format
+    image.draft(None, target_size(image.size, max_side))
+    try:
+        image.load()
+        image = ImageOps.exif_transpose(image)
+    except (OSError, SyntaxError, ValueError):
+        raise ValidationError(
+            'Картинка повреждена.', code='invalid_image')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if fmt not in SAVE_OPTIONS:
+        fmt = 'PNG' if 'A' in image.getbands() else 'JPEG'
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    # Из метаданных сохраняются только цветовой профиль и прозрачность.
+    options = dict(SAVE_OPTIONS[fmt])
+    if 'icc_profile' in image.info and fmt != 'GIF':
+        options['icc_profile'] = image.info['icc_profile']
+    if 'transparency' in image.info and fmt in ('PNG', 'GIF'):
+        options['transparency'] = image.info['transparency']
+    output = SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(output, fmt, **options)
+    output.seek(0)
+    name, extension = os.path.splitext(upload.name)
+    if extension.lower() not in EXTENSIONS[fmt]:
+        extension = EXTENSIONS[fmt][0]
+    return File(output, name=name + extension)
+
+
+def webp_name(name):
+    return f'{name}.webp'
+
+
+def save_webp(name, storage):
+    """Кладёт рядом с картинкой name её WebP-вариант name.webp.
+
+    Без поддержки WebP в сборке Pillow или для анимации — None.
+    """
+    if not features.check('webp'):
+        return None
+    with storage.open(name) as source:
+        image = Image.open(source)
+        if getattr(image, 'is_animated', False):
+            return None
+        image.load()
+    output = SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(output, 'WEBP', **SAVE_OPTIONS['WEBP'])
+    output.seek(0)
+    variant = webp_name(name)
+    if storage.exists(variant):
+        storage.delete(variant)
+    return storage.save(variant, File(output, name=variant))
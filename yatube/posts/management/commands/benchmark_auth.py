@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+User = get_user_model()
+
+# Сессии в БД и пользователь из БД на каждый запрос — как в Django
+# по умолчанию — против сессий и пользователя из кеша.
+PROFILES = {
+    'Сессии и пользователь из БД': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_MIDDLEWARE':
+            'django.contrib.auth.middleware.AuthenticationMiddleware',
+    },
+    'Сессии и пользователь из кеша': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_MIDDLEWARE':
+            'users.middleware.CachedAuthenticationMiddleware',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет запросы в секунду к лентам от авторизованного пользователя '
+        'с сессиями и пользователем из БД и из кеша.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--username', default='bench_reader')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=options['username'])
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:follow_index'),
+            reverse('posts:profile', args=[user.username]),
+        ]
+        for name, profile in PROFILES.items():
+            middleware = [
+                profile['AUTHENTICATION_MIDDLEWARE']
+                if path.endswith('AuthenticationMiddleware') else path
+                for path in settings.MIDDLEWARE
+            ]
+            with override_settings(
+                SESSION_ENGINE=profile['SESSION_ENGINE'],
+                MIDDLEWARE=middleware,
+            ):
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.measure(user, urls, options['requests'])
+
+    def measure(self, user, urls, requests):
+        client = Client()
+        client.force_login(user)
+        for url in urls:
+            # Прогрев: кеш фрагментов и пользователя, первый COUNT.
+            client.get(url)
+        queries = 0
+        started = time.perf_counter()
+        for i in range(requests):
+            response = client.get(urls[i % len(urls)])
+            profile = getattr(response, 'profile', None)
+            queries += profile.queries if profile else 0
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'  {requests / elapsed:.0f} запросов/с, '
+            f'{queries / requests:.1f} SQL-запросов на запрос')
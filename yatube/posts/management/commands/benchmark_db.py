@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+
+from core.db.backends.sqlite3.base import DatabaseWrapper
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import (
+    DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connection,
+    connections, transaction,
+)
+from django.db.backends.signals import connection_created
+
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+MARKER = 'Комментарий для бенчмарка'
+
+# Настройки SQLite и Django по умолчанию: журнал с откатом, fsync на каждую
+# фиксацию, новое соединение на каждый запрос, BEGIN DEFERRED.
+PROFILES = {
+    'По умолчанию': {
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': False,
+        'OPTIONS': {
+            'pragmas': {
+                'journal_mode': 'DELETE',
+                'synchronous': 'FULL',
+                'busy_timeout': None,
+                'cache_size': None,
+                'mmap_size': None,
+                'temp_store': None,
+            },
+        },
+    },
+    'WAL, прагмы, CONN_MAX_AGE': {
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет чтение и запись SQLite в несколько потоков с настройками '
+        'по умолчанию и с профилем core.db.backends.sqlite3. Каждая операция '
+        'обёрнута как HTTP-запрос (close_old_connections до и после). '
+        'Запускайте на копии базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument(
+            '--duration', type=float, default=5,
+            help='Секунд на каждый профиль.')
+
+    def handle(self, *args, **options):
+        if not isinstance(connections[DEFAULT_DB_ALIAS], DatabaseWrapper):
+            raise CommandError(
+                'Бенчмарк рассчитан на ENGINE core.db.backends.sqlite3.')
+        self.post_ids = list(
+            Post.objects.order_by('-id').values_list('id', flat=True)[:1000])
+        if not self.post_ids:
+            raise CommandError('В базе нет постов.')
+        self.author, _ = User.objects.get_or_create(username='bench_writer')
+        settings_dict = connections.databases[DEFAULT_DB_ALIAS]
+        original = dict(settings_dict)
+        self.lock = threading.Lock()
+        self.connections = 0
+        connection_created.connect(self.count_connection)
+        try:
+            for name, profile in PROFILES.items():
+                # Новые соединения потоков читают этот же словарь настроек.
+                connection.close()
+                settings_dict.update(profile)
+                # Журнал переключается только без других соединений:
+                # переключаем до старта потоков.
+                connection.ensure_connection()
+                connection.close()
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.run_profile(options)
+        finally:
+            connection_created.disconnect(self.count_connection)
+            connection.close()
+            settings_dict.clear()
+            settings_dict.update(original)
+            Comment.objects.filter(text=MARKER).delete()
+
+    def count_connection(self, **kwargs):
+        with self.lock:
+            self.connections += 1
+
+    def read(self):
+        list(Post.objects.for_feed()[:settings.PAGE_SIZE])
+        comments = Comment.objects.filter(post_id=random.choice(self.post_ids))
+        list(comments.select_related('author')[:20])
+
+    def write(self):
+        # Как add_comment: сначала чтение поста, затем запись в той же
+        # транзакции — при BEGIN DEFERRED это повышение блокировки.
+        with transaction.atomic():
+            post = Post.objects.only('id').get(
+                id=random.choice(self.post_ids))
+            Comment.objects.create(post=post, author=self.author, text=MARKER)
+
+    def worker(self, operation, stats, deadline):
+        done = errors = 0
+        while time.perf_counter() < deadline:
+            close_old_connections()
+            try:
+                operation()
+                done += 1
+            except OperationalError:
+                errors += 1
+            finally:
+                close_old_connections()
+        connection.close()
+        with self.lock:
+            stats['done'] += done
+            stats['errors'] += errors
+
+    def run_profile(self, options):
+        self.connections = 0
+        stats = {
+            'read': {'done': 0, 'errors': 0},
+            'write': {'done': 0, 'errors': 0},
+        }
+        duration = options['duration']
+        deadline = time.perf_counter() + duration
+        threads = [
+            threading.Thread(
+                target=self.worker,
+                args=(getattr(self, kind), stats[kind], deadline))
+            for kind, count in (
+                ('read', options['readers']), ('write', options['writers']))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for kind, label in (('read', 'чтение'), ('write', 'запись')):
+            self.stdout.write(
+                f'  {label}: {stats[kind]["done"] / duration:.0f} оп/с, '
+                f'ошибок «database is locked»: {stats[kind]["errors"]}')
+        self.stdout.write(f'  открыто соединений: {self.connections}')
@@ -0,0 +1,158 @@
+import random
+import time
+from datetime import timedelta
+
+from core.paginator import CursorPaginator
+from core.utils import keep_auto_now
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from posts import counters, timeline
+from posts.models import Follow, Group, Post
+
+User = get_user_model()
+
+FEED_INDEXES = ('post_group_pub_date_idx', 'post_author_pub_date_idx')
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу постами и печатает EXPLAIN и время выборки лент '
+        'без составных индексов и с ними. Запускайте на копии базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--follows', type=int, default=100)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--deep-page', type=int, default=1000,
+            help='Номер страницы для замера OFFSET-пагинации.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.seed()
+        feeds = self.feeds()
+        indexes = [
+            index for index in Post._meta.indexes
+            if index.name in FEED_INDEXES
+        ]
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.remove_index(Post, index)
+        self.analyze()
+        self.stdout.write(self.style.MIGRATE_HEADING('Без составных индексов'))
+        try:
+            self.measure(feeds)
+        finally:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Post, index)
+        self.analyze()
+        self.stdout.write(self.style.MIGRATE_HEADING('С составными индексами'))
+        self.measure(feeds)
+
+    def seed(self):
+        options = self.options
+        authors = list(User.objects.filter(
+            username__startswith='bench_author_').values_list('id', flat=True))
+        if len(authors) < options['authors']:
+            User.objects.bulk_create(
+                User(username=f'bench_author_{i}')
+                for i in range(len(authors), options['authors'])
+            )
+            authors = list(User.objects.filter(
+                username__startswith='bench_author_'
+            ).values_list('id', flat=True))
+        groups = list(Group.objects.filter(
+            slug__startswith='bench-group-').values_list('id', flat=True))
+        if len(groups) < options['groups']:
+            Group.objects.bulk_create(
+                Group(title=f'Группа {i}', slug=f'bench-group-{i}',
+                      description='Группа для бенчмарка')
+                for i in range(len(groups), options['groups'])
+            )
+            groups = list(Group.objects.filter(
+                slug__startswith='bench-group-'
+            ).values_list('id', flat=True))
+        missing = options['posts'] - Post.objects.count()
+        started = timezone.now()
+        batch_size = options['batch_size']
+        with keep_auto_now(Post, 'pub_date'):
+            for offset in range(0, max(missing, 0), batch_size):
+                with transaction.atomic():
+                    Post.objects.bulk_create(
+                        Post(
+                            text='Пост для бенчмарка',
+                            author_id=random.choice(authors),
+                            group_id=random.choice(groups),
+                            pub_date=started - timedelta(
+                                minutes=offset + i),
+                        )
+                        for i in range(min(batch_size, missing - offset))
+                    )
+                self.stdout.write(
+                    f'Создано постов: {min(offset + batch_size, missing)}'
+                    f'/{missing}')
+        self.reader, created = User.objects.get_or_create(
+            username='bench_reader')
+        if created:
+            Follow.objects.bulk_create(
+                Follow(user=self.reader, author_id=author_id)
+                for author_id in authors[:options['follows']]
+            )
+            with transaction.atomic():
+                timeline.rebuild(self.reader)
+        # bulk_create обходит сигналы счётчиков.
+        counters.recount_users(authors + [self.reader.id])
+
+    def feeds(self):
+        group = Group.objects.annotate(
+            total=Count('posts')).order_by('-total').first()
+        author = User.objects.annotate(
+            total=Count('posts')).order_by('-total').first()
+        return {
+            'index': (Post.objects.for_feed(), {}),
+            f'group_posts ({group.slug})':
+                (Post.objects.for_feed().filter(group=group), {}),
+            f'profile ({author.username})':
+                (Post.objects.for_feed().filter(author=author), {}),
+            'follow_index': timeline.follow_feed(self.reader),
+        }
+
+    def analyze(self):
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def timeit(self, func):
+        timings = []
+        for _ in range(self.options['repeat']):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    def measure(self, feeds):
+        deep_page = self.options['deep_page']
+        for name, (queryset, options) in feeds.items():
+            paginator = CursorPaginator(
+                queryset, settings.PAGE_SIZE, **options)
+            first = paginator.get_cursor_page()
+            self.stdout.write(self.style.SQL_TABLE(name))
+            first_page = paginator.object_list[:settings.PAGE_SIZE]
+            self.stdout.write(first_page.explain())
+            cursor_ms = self.timeit(
+                lambda: paginator.get_cursor_page(first.next_cursor))
+            offset_ms = self.timeit(
+                lambda: list(paginator.get_page(deep_page).object_list))
+            self.stdout.write(
+                f'  курсор, стр. 2: {cursor_ms:.2f} мс; '
+                f'OFFSET, стр. {deep_page}: {offset_ms:.2f} мс')
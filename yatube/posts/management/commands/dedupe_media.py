@@ -0,0 +1,123 @@
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count
+from sorl.thumbnail import default
+
+from posts import images, thumbnails
+from posts.models import MediaFile, Post
+from posts.storage import HASHED, file_digest, hashed_name
+
+
+def migrate(name):
+    """(name, имя в хранилище по хешу); без файла — (name, None).
+
+    Старый файл остаётся на месте, пока на него ссылаются посты.
+    """
+    if HASHED.search(name):
+        return name, name
+    storage = Post._meta.get_field('image').storage
+    try:
+        with storage.open(name) as file:
+            digest = file_digest(file)
+    except OSError:
+        return name, None
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    new_name = hashed_name(directory, digest, extension)
+    if not storage.exists(new_name):
+        temp_path = f'{storage.path(new_name)}.{os.getpid()}.part'
+        os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+        try:
+            # Жёсткая ссылка не копирует данные; между томами — копия.
+            os.link(storage.path(name), temp_path)
+        except OSError:
+            shutil.copyfile(storage.path(name), temp_path)
+        try:
+            storage.store(temp_path, new_name)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return name, new_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище по хешу содержимого: '
+        'одинаковые файлы склеиваются в один, счётчики ссылок '
+        'пересчитываются, миниатюры создаются заново. Файлы хешируются '
+        'на всех ядрах. Запускайте, пока посты не редактируются: '
+        'счётчики пересчитываются по постам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; 0 — всё в этом процессе. '
+                 'По умолчанию — по числу ядер.')
+        parser.add_argument('--chunk-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        names = list(Post.objects.exclude(image='').order_by(
+            'image').values_list('image', flat=True).distinct())
+        if options['workers']:
+            # Процессы наследуют открытые соединения при fork — закрываем.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                renamed, missing, files = self.dedupe(names, pool)
+        else:
+            renamed, missing, files = self.dedupe(names, None)
+        storage = Post._meta.get_field('image').storage
+        for name in renamed:
+            default.kvstore.delete(thumbnails.source_file(name))
+            storage.delete(name)
+            storage.delete(images.webp_name(name))
+        self.stdout.write(
+            f'Перенесено картинок: {len(renamed)}, '
+            f'файлов после склейки: {files}, не найдено: {missing}')
+
+    def dedupe(self, names, pool):
+        """Переименовывает картинки постов; старые файлы ещё на месте."""
+        if pool is None:
+            run_map, generate = map, thumbnails.generate
+        else:
+            run_map = partial(pool.map, chunksize=self.chunk_size)
+            generate = thumbnails.generate_in_worker
+        results = run_map(migrate, names)
+        renamed = {}
+        missing = 0
+        while True:
+            batch = list(islice(results, self.chunk_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                for name, new_name in batch:
+                    if new_name is None:
+                        missing += 1
+                    elif new_name != name:
+                        Post.objects.filter(image=name).update(image=new_name)
+                        renamed[name] = new_name
+        files = self.recount()
+        if pool is not None:
+            connections.close_all()
+        # Миниатюры новых имён; generate() заодно сбрасывает кеш лент.
+        for _ in run_map(generate, set(renamed.values())):
+            pass
+        return renamed, missing, files
+
+    def recount(self):
+        """Пересчитывает MediaFile по постам; возвращает число файлов."""
+        counts = Post.objects.exclude(image='').order_by().values(
+            'image').annotate(refs=Count('id')).values_list('image', 'refs')
+        with transaction.atomic():
+            MediaFile.objects.all().delete()
+            created = MediaFile.objects.bulk_create(
+                [MediaFile(name=name, refs=refs) for name, refs in counts],
+                batch_size=500)
+        return len(created)
@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает посты автора или группы в JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument('--author', help='Username автора.')
+        source.add_argument('--group', help='Slug группы.')
+        parser.add_argument(
+            '--format', choices=tuple(export.FORMATS), default='jsonl')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument(
+            '--images', action='store_true',
+            help='Собрать посты и их картинки в zip.')
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл; по умолчанию — stdout.')
+
+    def handle(self, *args, **options):
+        # Группа не required: call_command в Django 2.2 не понимает
+        # обязательных групп аргументов.
+        if not (options['author'] or options['group']):
+            raise CommandError('Укажите --author или --group.')
+        if options['author']:
+            name = options['author']
+            if not User.objects.filter(username=name).exists():
+                raise CommandError(f'Нет автора {name}.')
+            posts = Post.objects.filter(author__username=name)
+        else:
+            name = options['group']
+            if not Group.objects.filter(slug=name).exists():
+                raise CommandError(f'Нет группы {name}.')
+            posts = Post.objects.filter(group__slug=name)
+        chunks, filename = export.export(
+            posts, options['format'], compress=options['gzip'],
+            images=options['images'],
+            storage=Post._meta.get_field('image').storage, name=name)
+        output = options['output']
+        if output == '-':
+            self.write(chunks, sys.stdout.buffer)
+        else:
+            with open(output, 'wb') as file:
+                self.write(chunks, file)
+            self.stderr.write(f'Выгрузка {filename} записана в {output}')
+
+    def write(self, chunks, file):
+        for chunk in chunks:
+            file.write(chunk)
+        file.flush()
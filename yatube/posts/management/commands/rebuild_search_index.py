@@ -0,0 +1,24 @@
+from core.utils import chunks
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        backend.clear()
+        total = 0
+        for ids in chunks(Post.objects.all(), options['chunk_size']):
+            posts = Post.objects.filter(pk__in=ids).values_list('id', 'text')
+            with transaction.atomic():
+                backend.index(posts)
+            total += len(ids)
+        self.stdout.write(f'Проиндексировано постов: {total}')
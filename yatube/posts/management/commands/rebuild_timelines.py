@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи; по умолчанию — все, у кого есть подписки '
+                 'или записи в ленте.')
+
+    def handle(self, *args, **options):
+        # С записями без подписок — чтобы очистить ленты отписавшихся.
+        users = User.objects.filter(
+            Q(id__in=Follow.objects.values('user_id'))
+            | Q(id__in=TimelineEntry.objects.values('user_id')))
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        rebuilt = 0
+        for user in users.iterator():
+            with transaction.atomic():
+                timeline.rebuild(user)
+            rebuilt += 1
+        self.stdout.write(f'Пересобрано лент: {rebuilt}')
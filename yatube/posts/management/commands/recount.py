@@ -0,0 +1,29 @@
+from core.utils import chunks
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+from posts.models import Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        size = options['chunk_size']
+        users = 0
+        for ids in chunks(User.objects.all(), size):
+            with transaction.atomic():
+                users += counters.recount_users(ids)
+        posts = 0
+        for ids in chunks(Post.objects.all(), size):
+            with transaction.atomic():
+                posts += counters.recount_posts(ids)
+        self.stdout.write(
+            f'Пересчитано пользователей: {users}, постов: {posts}')
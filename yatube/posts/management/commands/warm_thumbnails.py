@@ -0,0 +1,32 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заранее создаёт миниатюры картинок постов на всех ядрах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; по умолчанию — по числу ядер.')
+        parser.add_argument('--chunk-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True).order_by('id')
+        # Процессы наследуют открытые соединения при fork — закрываем их.
+        connections.close_all()
+        done = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for _ in pool.map(
+                    thumbnails.generate_in_worker,
+                    names.iterator(chunk_size=options['chunk_size']),
+                    chunksize=options['chunk_size']):
+                done += 1
+        self.stdout.write(f'Обработано картинок: {done}')
@@ -0,0 +1,84 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:42
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """Раскладывает по лентам посты авторов из уже существующих подписок.
+
+    Как timeline.add_author: до TIMELINE_BACKFILL последних постов на
+    автора. Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT,
+    пропускаются — их посты подмешиваются в ленту при чтении.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    followers = defaultdict(set)
+    pairs = Follow.objects.values_list('author_id', 'user_id')
+    for author_id, user_id in pairs.iterator():
+        followers[author_id].add(user_id)
+    entries = []
+    for author_id, users in followers.items():
+        if len(users) > settings.TIMELINE_FANOUT_LIMIT:
+            continue
+        posts = Post.objects.filter(
+            author_id=author_id
+        ).order_by('-pub_date', '-id').values_list('id', 'pub_date')
+        for post_id, pub_date in posts[:settings.TIMELINE_BACKFILL]:
+            entries.extend(
+                TimelineEntry(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id in users
+            )
+        if len(entries) >= settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(
+                entries, batch_size=settings.TIMELINE_BATCH_SIZE)
+            entries = []
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=settings.TIMELINE_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0016_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор поста')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:43
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+BATCH_SIZE = 1000
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    """Оставляет по одной подписке на пару (user, author), удаляя пачками."""
+    Follow = apps.get_model('posts', 'Follow')
+    duplicates = Follow.objects.values('user', 'author').annotate(
+        total=Count('id'), keep=Min('id')
+    ).filter(total__gt=1)
+    batch = []
+    for pair in list(duplicates):
+        batch.extend(Follow.objects.filter(
+            user=pair['user'], author=pair['author']
+        ).exclude(id=pair['keep']).values_list('id', flat=True))
+        if len(batch) >= BATCH_SIZE:
+            Follow.objects.filter(id__in=batch).delete()
+            batch = []
+    if batch:
+        Follow.objects.filter(id__in=batch).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
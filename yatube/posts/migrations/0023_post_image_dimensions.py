@@ -0,0 +1,57 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:32
+
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models
+
+
+def fill_dimensions(apps, schema_editor):
+    # Размеры уже загруженных картинок читаются из заголовков файлов;
+    # отсутствующие и битые файлы остаются без размеров.
+    Post = apps.get_model('posts', 'Post')
+    storage = Post._meta.get_field('image').storage
+    posts = Post.objects.exclude(image='').filter(
+        image_width__isnull=True).only('id', 'image').order_by('id')
+    last_id = 0
+    while True:
+        # Пачками по id: чтение не держит курсор открытым под записью.
+        batch = list(posts.filter(id__gt=last_id)[:1000])
+        if not batch:
+            return
+        last_id = batch[-1].id
+        measured = []
+        for post in batch:
+            try:
+                with storage.open(post.image.name) as file:
+                    width, height = get_image_dimensions(file)
+            except OSError:
+                continue
+            if width is not None:
+                post.image_width, post.image_height = width, height
+                measured.append(post)
+        Post.objects.bulk_update(measured, ['image_width', 'image_height'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_post_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, height_field='image_height', upload_to='posts/', verbose_name='Картинка', width_field='image_width'),
+        ),
+        migrations.RunPython(fill_dimensions, migrations.RunPython.noop),
+    ]
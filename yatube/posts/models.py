@@ -1,6 +1,10 @@
+from core.db.fields import FullTextField
 from core.models import CreatedModel
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.signals import post_init
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -25,6 +29,16 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа одним JOIN, только нужные поля."""
+        return self.select_related('author', 'group').only(
+            'id', 'text', 'pub_date', 'image', 'image_width', 'image_height',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__slug',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста', help_text='Текст нового поста')
@@ -51,18 +65,52 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=ContentAddressedStorage(),
+        blank=True,
+        width_field='image_width',
+        height_field='image_height',
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False)
+    comment_count = models.PositiveIntegerField(
+        'Комментариев', default=0, editable=False)
+    updated = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_pub_date_idx'),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_pub_date_idx'),
+            # Last-Modified лент группы и автора (posts.conditional).
+            models.Index(
+                fields=('group', '-updated'), name='post_group_updated_idx'),
+            models.Index(
+                fields=('author', '-updated'),
+                name='post_author_updated_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
+# ImageField на post_init дочитывает незаполненные размеры из файла (а
+# отложенные поля — из БД) для каждого поста ленты. Размеры считаются при
+# присваивании нового файла, а старым постам их проставила миграция 0023.
+post_init.disconnect(
+    Post._meta.get_field('image').update_dimension_fields, sender=Post)
+
+
 class Comment(CreatedModel):
     post = models.ForeignKey(
         Post,
@@ -81,6 +129,10 @@ class Comment(CreatedModel):
 
     class Meta:
         ordering = ('created',)
+        indexes = [
+            models.Index(
+                fields=('post', 'created'), name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -99,3 +151,108 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='Автор',
         help_text='Юзверь, на которого подписываются')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='unique_follow'),
+        ]
+        indexes = [
+            models.Index(
+                fields=('author', 'user'), name='follow_author_user_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок (fan-out on write)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_pub_date_idx'),
+            models.Index(
+                fields=('user', 'author'), name='timeline_user_author_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Обновляются атомарно через F() при создании и удалении постов,
+    комментариев и подписок; расхождения чинит команда recount.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class PostSearchIndex(models.Model):
+    """Строка поискового индекса SQLite FTS5 (rowid = id поста).
+
+    Таблицу создаёт и наполняет бэкенд posts.search.backends, а модель
+    нужна, чтобы ORM мог присоединить индекс к постам одним JOIN.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index',
+        verbose_name='Пост')
+    text = FullTextField('Текст')
+
+    class Meta:
+        managed = False
+        db_table = 'posts_post_fts'
+        verbose_name = 'Поисковый индекс поста'
+        verbose_name_plural = 'Поисковый индекс постов'
+
+
+class MediaFile(models.Model):
+    """Счётчик ссылок на файл в ContentAddressedStorage."""
+    name = models.CharField('Файл', max_length=255, primary_key=True)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,34 @@
+"""Полнотекстовый поиск по постам.
+
+Бэкенд задаётся настройкой SEARCH_BACKEND. Индекс обновляют сигналы
+Post, а целиком его пересобирает команда rebuild_search_index.
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.SEARCH_BACKEND)()
+    return _backend
+
+
+def search(queryset, query):
+    """Посты queryset по запросу с аннотацией search_rank."""
+    return get_backend().search(queryset, query)
+
+
+def filter(queryset, query):
+    """Посты queryset по запросу, без ранжирования — например, для админки."""
+    return get_backend().filter(queryset, query)
+
+
+def index(posts):
+    get_backend().index((post.id, post.text) for post in posts)
+
+
+def remove(post_ids):
+    get_backend().remove(post_ids)
@@ -0,0 +1,94 @@
+"""Бэкенды полнотекстового поиска по постам.
+
+Бэкенд держит индекс текстов постов и отбирает посты по запросу,
+проставляя им search_rank: чем меньше, тем выше пост в выдаче.
+"""
+from django.db import connection
+from django.db.models import (
+    ExpressionWrapper, F, FloatField, IntegerField, Q)
+from django.db.models.expressions import RawSQL
+
+
+class BaseSearchBackend:
+    """Бэкенд без индекса: LIKE по тексту, свежие посты выше.
+
+    Годится для любой БД и служит образцом интерфейса: бэкенду с индексом
+    (FTS5, tsvector) нужно переопределить все методы, а структуры индекса
+    создать своей миграцией.
+    """
+
+    def index(self, posts):
+        """Добавляет или обновляет в индексе пары (id, текст)."""
+
+    def remove(self, post_ids):
+        """Убирает посты из индекса."""
+
+    def clear(self):
+        """Очищает индекс перед полной пересборкой."""
+
+    def filter(self, queryset, query):
+        """Посты queryset, подходящие под запрос, без ранжирования."""
+        terms = query.split()
+        if not terms:
+            return queryset.none()
+        condition = Q()
+        for term in terms:
+            condition &= Q(text__icontains=term)
+        return queryset.filter(condition)
+
+    def rank(self):
+        """Выражение search_rank для постов, отобранных filter()."""
+        return ExpressionWrapper(F('id') * -1, output_field=IntegerField())
+
+    def search(self, queryset, query):
+        return self.filter(queryset, query).annotate(search_rank=self.rank())
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """Индекс в виртуальной таблице FTS5, ранжирование по bm25.
+
+    Таблицу создаёт и заполняет миграция 0021_search_index.
+    """
+
+    table = 'posts_post_fts'
+
+    def index(self, posts):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, text) '
+                f'VALUES (%s, %s)',
+                list(posts),
+            )
+
+    def remove(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+                post_ids,
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def match_expression(self, query):
+        """Запрос пользователя как набор фраз FTS5: без операторов и ошибок
+        синтаксиса, все слова обязательны."""
+        terms = query.split()
+        return ' '.join('"{}"'.format(term.replace('"', '""'))
+                        for term in terms)
+
+    def filter(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(search_index__text__match=match)
+
+    def rank(self):
+        # bm25() понимает только имя таблицы, а не псевдоним: Django
+        # присоединяет индекс под именем таблицы, пока JOIN один.
+        return RawSQL(f'bm25({self.table})', [], output_field=FloatField())
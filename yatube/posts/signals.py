@@ -0,0 +1,180 @@
+from core.cache import generations
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import counters, search, thumbnails, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# Счётчики подключены первыми: раскладка ленты смотрит на followers_count.
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    # И при loaddata (raw): без строки счётчиков профиль не знает число
+    # постов. Строка из той же фикстуры потом просто перезапишет эту.
+    if created:
+        UserStats.objects.get_or_create(user_id=instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Каскад удалит UserStats вместе с пользователем — счётчики не трогаем.
+    counters.deleting_users().add(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    counters.deleting_users().discard(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def post_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def post_uncounted(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_post(instance.post_id, 1)
+        counters.change_user(instance.author_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncounted(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+    counters.change_user(instance.author_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user(instance.user_id, following_count=1)
+        counters.change_user(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncounted(sender, instance, **kwargs):
+    counters.change_user(instance.user_id, following_count=-1)
+    counters.change_user(instance.author_id, followers_count=-1)
+
+
+@receiver(post_init, sender=Post)
+def remember_initial(sender, instance, **kwargs):
+    # __dict__, чтобы не загружать отложенные поля лишними запросами.
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    image = instance.__dict__.get('image')
+    instance._initial_image = getattr(image, 'name', image)
+    instance._initial_text = instance.__dict__.get('text')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    generations.bump(
+        'index',
+        f'profile:{instance.author_id}',
+        f'group:{instance.group_id}',
+        f'group:{instance._initial_group_id}',
+    )
+
+
+# Поля автора, которые видны в лентах.
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_init, sender=User)
+def remember_author_name(sender, instance, **kwargs):
+    instance._initial_name = tuple(
+        instance.__dict__.get(field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def author_renamed(sender, instance, created, raw=False, **kwargs):
+    name = tuple(getattr(instance, field) for field in AUTHOR_FIELDS)
+    if created or raw or name == instance._initial_name:
+        # Вход (last_login) и смена пароля ленты не меняют.
+        return
+    instance._initial_name = name
+    group_ids = Post.objects.filter(author=instance).exclude(
+        group=None).order_by().values_list('group_id', flat=True).distinct()
+    # index — это и все ленты подписок: их ключи включают его поколение.
+    generations.bump(
+        'index',
+        f'profile:{instance.pk}',
+        *(f'group:{group_id}' for group_id in group_ids),
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Ссылки на группы есть во всех лентах.
+    generations.bump('groups')
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def post_thumbnails(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance.image:
+        return
+    if created or instance.image.name != instance._initial_image:
+        thumbnails.schedule_on_commit(instance.image.name)
+
+
+@receiver(pre_save, sender=Post)
+def post_image_uploading(sender, instance, **kwargs):
+    # Файл ещё не записан в хранилище — save() возьмёт на него ссылку.
+    image = instance.__dict__.get('image')
+    instance._image_uploaded = bool(
+        image and not getattr(image, '_committed', True))
+
+
+@receiver(post_save, sender=Post)
+def post_image_replaced(sender, instance, created, raw=False, **kwargs):
+    old = instance._initial_image
+    if created or raw or not old:
+        return
+    # Повторная загрузка того же содержимого тоже взяла ссылку.
+    if instance._image_uploaded or old != instance.image.name:
+        thumbnails.release_on_commit(old)
+        instance._initial_image = instance.image.name
+
+
+@receiver(post_delete, sender=Post)
+def post_image_released(sender, instance, **kwargs):
+    if instance.image:
+        thumbnails.release_on_commit(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, created, **kwargs):
+    if created or instance.text != instance._initial_text:
+        search.index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    search.remove([instance.id])
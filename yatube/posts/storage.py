@@ -0,0 +1,134 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл кладётся по пути из SHA-256 своего содержимого:
+posts/ab/cd/abcd….jpg. Одинаковые загрузки — репосты, повторы — попадают
+в один файл, а sorl-thumbnail, который строит имя миниатюры из имени
+исходника, сам делит между ними один набор миниатюр. Сколько записей
+ссылается на файл, считает MediaFile: release() снимает ссылку и удаляет
+файл вместе с последней.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from collections import defaultdict
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+HASHED = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def hashed_name(directory, digest, extension):
+    return f'{directory}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def file_digest(file, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, где имя файла — хеш содержимого.
+
+    upload_to задаёт только каталог, а от исходного имени остаётся
+    расширение. delete() удаляет файл безусловно, как у родителя, —
+    ссылки снимает release().
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя всё равно заменит хеш — не проверяем занятость.
+        return name
+
+    def _save(self, name, content):
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        temp_dir = self.path(directory)
+        os.makedirs(temp_dir, exist_ok=True)
+        # Хешируем во время записи: содержимое читается один раз.
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    temp.write(chunk)
+            name = hashed_name(directory, digest.hexdigest(), extension)
+            # Ссылка берётся до появления файла: release() того же файла
+            # в другом процессе либо закончится раньше, либо не удалит его.
+            self.acquire(name)
+            self.store(temp_path, name)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def store(self, path, name):
+        """Переносит готовый файл path под name, если такого ещё нет."""
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return False
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        # Временный файл лежит в том же MEDIA_ROOT, поэтому переименование
+        # атомарно: параллельная загрузка того же содержимого увидит либо
+        # целый файл, либо никакого.
+        os.replace(path, full_path)
+        return True
+
+    def acquire(self, name, count=1):
+        from .models import MediaFile
+
+        # INSERT OR IGNORE и UPDATE — без чтения и без точки сохранения.
+        MediaFile.objects.bulk_create(
+            [MediaFile(name=name)], ignore_conflicts=True)
+        MediaFile.objects.filter(name=name).update(refs=F('refs') + count)
+
+    def acquire_many(self, counts):
+        """Берёт ссылки пачкой: counts — имя → число новых ссылок.
+
+        Для записей, созданных в обход save() (bulk_create): иначе их
+        удаление снимет ссылку, которую они не брали. Имена не из этого
+        хранилища (ещё не перенесённые dedupe_media) не учитываются.
+        """
+        from .models import MediaFile
+
+        by_count = defaultdict(list)
+        for name, count in counts.items():
+            if HASHED.search(name):
+                by_count[count].append(name)
+        if not by_count:
+            return
+        MediaFile.objects.bulk_create(
+            [MediaFile(name=name) for names in by_count.values()
+             for name in names],
+            ignore_conflicts=True)
+        for count, names in by_count.items():
+            MediaFile.objects.filter(name__in=names).update(
+                refs=F('refs') + count)
+
+    def release(self, name):
+        """Снимает ссылку на name и с последней удаляет файл.
+
+        True — файл удалён. Файлы без учёта (загруженные до этого
+        хранилища и ещё не перенесённые dedupe_media) не удаляются.
+        """
+        from .models import MediaFile
+
+        with transaction.atomic():
+            MediaFile.objects.filter(name=name, refs__gt=0).update(
+                refs=F('refs') - 1)
+            if not MediaFile.objects.filter(name=name, refs=0).delete()[0]:
+                return False
+            # Внутри транзакции: acquire() того же имени ждёт её конца.
+            self.delete(name)
+        return True
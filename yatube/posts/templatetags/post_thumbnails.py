@@ -0,0 +1,29 @@
+from django import template
+
+from posts.thumbnails import prefetch
+
+register = template.Library()
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts):
+    """{% prefetch_thumbnails page_obj %} — миниатюры всей страницы разом.
+
+    Ставится внутри кешируемого фрагмента: при попадании в кеш
+    хранилище миниатюр не опрашивается вовсе.
+    """
+    prefetch(posts)
+    return ''
+
+
+@register.inclusion_tag('posts/includes/feed_image.html')
+def feed_image(post, loading='lazy'):
+    """{% feed_image post %} — <picture> с вариантами или заглушка.
+
+    Варианты генерирует фоновый конвейер (posts.thumbnails), поэтому
+    пока их нет, вместо картинки показывается заглушка. Картинку в
+    первом экране стоит грузить сразу: loading='eager'.
+    """
+    if not hasattr(post, 'feed_image'):
+        prefetch([post])
+    return {'post': post, 'im': post.feed_image, 'loading': loading}
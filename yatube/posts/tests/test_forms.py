@@ -1,3 +1,5 @@
+import io
+import re
 import shutil
 import tempfile
 
@@ -6,6 +8,8 @@ from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from posts.forms import PostForm
 from posts.models import Comment, Group, Post
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -47,7 +51,9 @@ class PostCreateFormTests(TestCase):
             content=small_gif,
             content_type='image/gif'
         )
-        self.image = 'posts/small.gif'
+        # Хранилище адресует файлы по SHA-256 содержимого.
+        self.image = re.compile(
+            r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$')
 
     def test_create_post(self):
         """Валидная форма создает запись в Post."""
@@ -69,7 +75,7 @@ class PostCreateFormTests(TestCase):
         last_post = Post.objects.latest('id')
         self.assertEqual(last_post.text, form_data_create['text'])
         self.assertEqual(last_post.group, self.group)
-        self.assertEqual(last_post.image, self.image)
+        self.assertRegex(last_post.image.name, self.image)
 
     def test_edit_post(self):
         """Валидная форма изменяет запись в Post."""
@@ -120,3 +126,72 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(last_comment.text, form_data_comment['text'])
         self.assertEqual(last_comment.author, self.user)
         self.assertEqual(last_comment.post, post_comment)
+
+
+def jpeg_upload(size, **save_options):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', **save_options)
+    return SimpleUploadedFile(
+        'photo.jpeg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIDE=100)
+class ImageProcessingTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='photographer')
+
+    def save_post(self, upload):
+        form = PostForm({'text': 'Фото'}, files={'image': upload})
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.author = self.user
+        post.save()
+        return Post.objects.get(id=post.id)
+
+    def test_large_image_downscaled(self):
+        """Большая картинка ужимается, размеры сохраняются в посте."""
+        post = self.save_post(jpeg_upload((400, 200)))
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_metadata_stripped(self):
+        """EXIF выбрасывается, поворот из него применяется к пикселям."""
+        exif = Image.Exif()
+        # 0x0112 — Orientation; 6 — повернуть на 90° по часовой.
+        exif[0x0112] = 6
+        post = self.save_post(jpeg_upload((80, 40), exif=exif.tobytes()))
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (40, 80))
+            self.assertNotIn('exif', image.info)
+        self.assertEqual((post.image_width, post.image_height), (40, 80))
+
+    def test_small_image_dimensions(self):
+        """Маленькая картинка не растягивается, размеры сохраняются."""
+        post = self.save_post(jpeg_upload((30, 20)))
+        self.assertEqual((post.image_width, post.image_height), (30, 20))
+        self.assertTrue(post.image.name.endswith('.jpeg'))
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_rejected(self):
+        """Картинка больше IMAGE_MAX_PIXELS отклоняется до декодирования."""
+        form = PostForm(
+            {'text': 'Фото'}, files={'image': jpeg_upload((100, 100))})
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    def test_corrupt_image_rejected(self):
+        """Обрезанный файл не попадает в хранилище."""
+        content = jpeg_upload((400, 400)).read()
+        upload = SimpleUploadedFile(
+            'broken.jpg', content[:len(content) // 2],
+            content_type='image/jpeg')
+        form = PostForm({'text': 'Фото'}, files={'image': upload})
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ..models import Follow, Post, TimelineEntry, UserStats
+
+User = get_user_model()
+
+
+class ImportContentTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'content.jsonl')
+        self.records = [
+            {'type': 'group', 'title': 'Группа', 'slug': 'imported',
+             'description': 'Описание'},
+            {'type': 'follow', 'user': 'reader', 'author': 'author'},
+            {'type': 'post', 'text': 'Старый пост', 'author': 'author',
+             'group': 'imported', 'pub_date': '2015-03-01T10:00:00'},
+            {'type': 'post', 'text': 'Пост без группы', 'author': 'author'},
+            {'type': 'post', 'text': 'Чужой пост', 'author': 'nobody'},
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, records):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def test_import_content(self):
+        """Импорт создаёт объекты пачками и делает работу сигналов."""
+        self.write(self.records)
+        out = StringIO()
+        call_command(
+            'import_content', self.path, batch_size=2, keep_dates=True,
+            stdout=out)
+        self.assertIn('пропущено: 1', out.getvalue())
+        post = Post.objects.get(text='Старый пост')
+        self.assertEqual(post.group.slug, 'imported')
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.updated, post.pub_date)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author).exists())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2)
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.followers_count, 1)
+
+    def test_import_resumes_from_checkpoint(self):
+        """Повторный запуск продолжает с контрольной точки."""
+        self.write(self.records[:3])
+        call_command('import_content', self.path, stdout=StringIO())
+        self.write(self.records[:3] + self.records[3:4])
+        call_command('import_content', self.path, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(
+            Post.objects.get(text='Старый пост').pub_date.year,
+            timezone.now().year)
+
+    def test_invalid_line_reported(self):
+        """Битая строка входа — CommandError с номером строки."""
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(self.records[0]) + '\n\n{"type": \n')
+        with self.assertRaisesMessage(CommandError, 'Строка 3:'):
+            call_command('import_content', self.path, stdout=StringIO())
+
+    def test_follows_fanned_out_in_batch(self):
+        """Подписки пачки раскладываются запросом на автора, не на пару."""
+        readers = [
+            User.objects.create_user(username=f'reader{i}') for i in range(3)]
+        other = User.objects.create_user(username='other')
+        Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=other, text='Другой пост')
+        self.write([
+            {'type': 'follow', 'user': reader.username, 'author': author}
+            for reader in readers for author in ('author', 'other')
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_content', self.path, stdout=StringIO())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user__in=readers).count(), 6)
+        self.assertEqual(
+            sum(query['sql'].startswith('SELECT "posts_post"."id"')
+                for query in queries),
+            2)
@@ -0,0 +1,32 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from ..models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class FillTimelinesTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        Follow.objects.create(user=self.reader, author=self.author)
+        # Как в базе до 0017: подписки есть, лент нет.
+        TimelineEntry.objects.all().delete()
+
+    @override_settings(TIMELINE_BACKFILL=2)
+    def test_fill_timelines(self):
+        """Миграция 0017 раскладывает существующие подписки по лентам."""
+        migration = import_module('posts.migrations.0017_timelineentry')
+        migration.fill_timelines(apps, None)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user=self.reader).values_list('post_id', flat=True)),
+            {self.posts[2].id, self.posts[1].id})
@@ -1,7 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
 
-from ..models import Comment, Group, Post
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -60,3 +65,81 @@ class CommentModelTest(TestCase):
         comment_text = CommentModelTest.comment
         expected_object_text = comment_text.text[:15]
         self.assertEqual(expected_object_text, str(comment_text))
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        author_stats = UserStats.objects.get(user=self.author)
+        reader_stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(reader_stats.comments_count, 1)
+        self.assertEqual(reader_stats.following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        author_stats.refresh_from_db()
+        reader_stats.refresh_from_db()
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(reader_stats.comments_count, 0)
+        self.assertEqual(reader_stats.following_count, 0)
+
+    def test_delete_user_with_posts_and_follows(self):
+        """Удаление пользователя не пересоздаёт его счётчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.author.delete()
+        self.assertFalse(UserStats.objects.filter(user_id=post.author_id))
+        stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(stats.followers_count, 0)
+        self.assertEqual(stats.following_count, 0)
+        self.assertEqual(stats.comments_count, 0)
+
+    def test_drifted_counter_does_not_go_negative(self):
+        """Разошедшийся счётчик при удалении остаётся нулём."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).update(posts_count=0)
+        post.delete()
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 0)
+
+    def test_profile_without_stats(self):
+        """Профиль пользователя без строки счётчиков открывается."""
+        User.objects.bulk_create([User(username='bulk')])
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'bulk'}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_loaded_user_gets_stats(self):
+        """Пользователь из фикстуры (raw) получает строку счётчиков."""
+        data = serializers.serialize(
+            'json', [User(id=1000, username='loaded')])
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        self.assertTrue(UserStats.objects.filter(user_id=1000).exists())
+
+    def test_recount_repairs_drift(self):
+        """Команда recount чинит разошедшиеся счётчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        Post.objects.filter(id=post.id).update(comment_count=7)
+        call_command('recount', chunk_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
@@ -1,14 +1,47 @@
+import base64
+import csv
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from core.cache import generations
+from core.paginator import WindowedPaginator
+from core.testing import QueryBudgetMixin
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from PIL import Image, features
+from posts import search, thumbnails
+from posts.models import (
+    Comment, Follow, Group, MediaFile, Post, TimelineEntry)
+from posts.urls import urlpatterns
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 User = get_user_model()
 
 
+def get_image_content(size=(50, 50), ext='png'):
+    content = BytesIO()
+    Image.new('RGB', size, color=(255, 0, 0)).save(content, ext)
+    return content.getvalue()
+
+
 class PostPagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -67,7 +100,7 @@ class PostPagesTests(TestCase):
         """Кеширование index.html работает."""
         content = self.authorized_client.get(
             reverse('posts:index')).content
-        self.post.delete()
+        Post.objects.filter(id=self.post.id).update(text='Без сигналов')
         content_cached = self.authorized_client.get(
             reverse('posts:index')).content
         self.assertEqual(content, content_cached)
@@ -76,6 +109,69 @@ class PostPagesTests(TestCase):
             reverse('posts:index')).content
         self.assertNotEqual(content, content_clear)
 
+    def test_feed_cache_invalidation(self):
+        """Изменение поста сбрасывает кеш всех его лент."""
+        cache.clear()
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', args={self.user}),
+        ]
+        for url in urls:
+            self.authorized_client.get(url)
+        self.post.text = 'Исправленный текст'
+        self.post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Исправленный текст')
+        self.post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertNotContains(response, 'Исправленный текст')
+
+    def test_author_rename_resets_feeds(self):
+        """Смена имени автора сбрасывает кеш лент с его постами."""
+        cache.clear()
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        ]
+        for url in urls:
+            self.authorized_client.get(url)
+        self.user.first_name = 'Переименованный'
+        self.user.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Переименованный')
+
+    def test_fragment_hit_skips_page_query(self):
+        """На попадании в кеш фрагмента страница постов не выбирается."""
+        cache.clear()
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        self.assertIsNone(response.context['page_obj'])
+        self.assertContains(response, self.post.text)
+        self.assertFalse(any(
+            'posts_post' in query['sql'] and 'LIMIT' in query['sql']
+            for query in queries.captured_queries))
+
+    def test_fragment_cache_metrics(self):
+        """Попадания и промахи кеша фрагментов видны в /metrics/."""
+        cache.clear()
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(reverse('posts:index'))
+        response = self.guest_client.get(reverse('metrics'))
+        self.assertContains(
+            response, 'yatube_fragment_cache_hits_total{fragment="index"} 1')
+        self.assertContains(
+            response,
+            'yatube_fragment_cache_misses_total{fragment="index"} 1')
+
     def check_post_page(self, test_post):
         self.assertEqual(test_post.text, self.post.text)
         self.assertEqual(test_post.group, self.post.group)
@@ -171,6 +267,101 @@ class PaginatorViewsTest(TestCase):
                 response = self.authorized_client.get(reverse_name + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_cursor_paginator(self):
+        """Курсорная пагинация листает вперёд и назад."""
+        templates_pages_names = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', args={self.user}),
+        ]
+        for reverse_name in templates_pages_names:
+            with self.subTest(reverse_name=reverse_name):
+                first = self.authorized_client.get(reverse_name)
+                first_page = first.context['page_obj']
+                self.assertEqual(len(first_page), 10)
+                self.assertIsNone(first_page.previous_cursor)
+                second = self.authorized_client.get(
+                    reverse_name, {'cursor': first_page.next_cursor})
+                second_page = second.context['page_obj']
+                self.assertEqual(len(second_page), 3)
+                self.assertIsNone(second_page.next_cursor)
+                back = self.authorized_client.get(
+                    reverse_name, {'cursor': second_page.previous_cursor})
+                self.assertEqual(
+                    list(back.context['page_obj']), list(first_page))
+                self.assertIsNone(back.context['page_obj'].previous_cursor)
+
+    def test_broken_cursor(self):
+        """Битый курсор отдаёт первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': 'не-курсор'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_forged_cursor(self):
+        """Курсор с чужими значениями тоже отдаёт первую страницу."""
+        payloads = (
+            ['n', ['garbage', 1]],
+            [{'a': 1}, 1],
+            ['n', [{'a': 1}, 1]],
+            ['n', [None, None]],
+            ['p', ['2021-01-01T00:00:00', 'x']],
+        )
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                cursor = base64.urlsafe_b64encode(
+                    json.dumps(payload).encode()).decode()
+                response = self.authorized_client.get(
+                    reverse('posts:index'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_paginator_window(self):
+        """Шаблон получает только окно номеров вокруг текущей страницы."""
+        paginator = WindowedPaginator(list(range(1000)), 10)
+        self.assertEqual(list(paginator.page(50).window), [48, 49, 50, 51, 52])
+        self.assertEqual(list(paginator.page(1).window), [1, 2, 3])
+        self.assertEqual(list(paginator.page(100).window), [98, 99, 100])
+
+    def test_cached_count(self):
+        """Число записей берётся из кеша и пересчитывается после поста."""
+        cache.clear()
+        posts = Post.objects.filter(group=self.group)
+
+        def count():
+            return WindowedPaginator(
+                posts, 10, count_key='test', count_generations=('test',)
+            ).count
+
+        self.assertEqual(count(), 13)
+        with self.assertNumQueries(0):
+            self.assertEqual(count(), 13)
+        Post.objects.create(text='Ещё', author=self.user, group=self.group)
+        generations.bump('test')
+        self.assertEqual(count(), 14)
+
+    @override_settings(PAGINATOR_EXACT_COUNT_THRESHOLD=0, BACKGROUND_WORKERS=0)
+    def test_estimated_count(self):
+        """Для больших таблиц сначала отдаётся оценка, точное — потом."""
+        cache.clear()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Post.objects.create(text='Без группы', author=self.user)
+        for expected in (13, 14):
+            paginator = WindowedPaginator(
+                Post.objects.all(), 10, count_key='test')
+            self.assertEqual(paginator.count, expected)
+
+    @override_settings(PAGINATOR_EXACT_COUNT_THRESHOLD=0, BACKGROUND_WORKERS=0)
+    def test_filtered_count_not_estimated(self):
+        """Размер всей таблицы не выдаётся за число постов ленты."""
+        cache.clear()
+        Post.objects.create(text='Без группы', author=self.user)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = WindowedPaginator(
+            Post.objects.filter(group=self.group), 10, count_key='test')
+        self.assertEqual(paginator.count, 13)
+
 
 class FollowViewsTest(TestCase):
 
@@ -205,6 +396,20 @@ class FollowViewsTest(TestCase):
             'posts:profile', args={self.author}))
         self.assertEqual(Follow.objects.count(), follow_count)
 
+    def test_follow_idempotent(self):
+        """Повторные подписка и отписка не ломаются и не плодят записи."""
+        url = reverse('posts:profile_follow', args={self.author})
+        self.authorized_client.get(url)
+        self.authorized_client.get(url)
+        self.assertEqual(Follow.objects.filter(
+            user=self.follower, author=self.author).count(), 1)
+        url = reverse('posts:profile_unfollow', args={self.author})
+        self.authorized_client.get(url)
+        response = self.authorized_client.get(url)
+        self.assertRedirects(response, reverse(
+            'posts:profile', args={self.author}))
+        self.assertFalse(Follow.objects.exists())
+
     def test_new_post_follow(self):
         self.authorized_client.get(
             reverse('posts:profile_follow', args={self.author}))
@@ -223,3 +428,752 @@ class FollowViewsTest(TestCase):
         response = self.authorized_client.get(
             reverse('posts:follow_index'))
         self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_timeline_fan_out(self):
+        """Новый пост раскладывается в ленты подписчиков."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(text='новый пост', author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.follower, post=post).exists())
+        Follow.objects.filter(user=self.follower, author=self.author).delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_fan_out_on_read(self):
+        """Посты авторов-звёзд попадают в ленту при чтении."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(text='пост звезды', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    def test_rebuild_timelines(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(self.post_author, response.context['page_obj'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_former_celebrity_posts_kept(self):
+        """Посты, написанные автором-звездой, остаются в лентах и после."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(text='пост звезды', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        with mock.patch(
+                'django.db.transaction.on_commit', lambda func: func()):
+            Follow.objects.filter(user=other).delete()
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    def test_rebuild_clears_unfollowed(self):
+        """rebuild_timelines чистит ленты тех, у кого подписок не осталось."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.filter(user=self.follower).delete()
+        TimelineEntry.objects.create(
+            user=self.follower, post=self.post_author, author=self.author,
+            pub_date=self.post_author.pub_date)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists())
+
+
+class FeedQueriesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Reader')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.group = Group.objects.create(
+            title='Группа', description='Описание', slug='feed-slug')
+        for i in range(12):
+            author = User.objects.create_user(
+                username=f'writer{i}', first_name='Имя', last_name='Фамилия')
+            Follow.objects.create(user=self.user, author=author)
+            Post.objects.create(
+                text='Текст поста', author=author, group=self.group)
+
+    def test_feed_queries(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        author = User.objects.get(username='writer0')
+        # Сессия и пользователь запроса после первого запроса берутся
+        # из кеша и запросов к БД не добавляют.
+        self.authorized_client.get(reverse('about:author'))
+        feeds = {
+            reverse('posts:index'): 2,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}): 3,
+            reverse('posts:profile', args={author}): 4,
+            # Записи ленты по её индексу, затем посты страницы по ключу.
+            reverse('posts:follow_index'): 3,
+        }
+        for url, queries in feeds.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.authorized_client.get(url)
+
+
+@override_settings(PROFILING_ENABLED=True)
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Budget')
+        self.author = User.objects.create_user(username='BudgetAuthor')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.group = Group.objects.create(
+            title='Группа', description='Описание', slug='budget-slug')
+        self.post = Post.objects.create(
+            text='Текст поста', author=self.user, group=self.group)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Комментарий')
+
+    def test_views_within_query_budget(self):
+        """Все view приложения posts укладываются в свой бюджет запросов."""
+        post_id = self.post.id
+        requests = {
+            'index': ('get', {}, {}),
+            'group_list': ('get', {'slug': self.group.slug}, {}),
+            'profile': ('get', {'username': self.user.username}, {}),
+            'profile_export': ('get', {'username': self.user.username}, {}),
+            'group_export': ('get', {'slug': self.group.slug}, {}),
+            'post_detail': ('get', {'post_id': post_id}, {}),
+            'post_comments': ('get', {'post_id': post_id}, {}),
+            'post_edit': (
+                'post', {'post_id': post_id}, {'text': 'Новый текст'}),
+            'add_comment': ('post', {'post_id': post_id}, {'text': 'Ещё'}),
+            'post_create': ('post', {}, {'text': 'Новый пост'}),
+            'follow_index': ('get', {}, {}),
+            'search': ('get', {}, {'q': 'текст'}),
+            'profile_follow': (
+                'get', {'username': self.author.username}, {}),
+            'profile_unfollow': (
+                'get', {'username': self.author.username}, {}),
+        }
+        self.assertAllViewsChecked(urlpatterns, requests)
+        for name, (method, kwargs, data) in requests.items():
+            with self.subTest(name=name):
+                url = reverse(f'posts:{name}', kwargs=kwargs)
+                # Бюджет — с холодным кешем: и сессия, и пользователь
+                # (users.auth) читаются из базы.
+                cache.clear()
+                response = getattr(self.authorized_client, method)(url, data)
+                self.assertWithinQueryBudget(response)
+                self.assertIn('sql;dur=', response['Server-Timing'])
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Reader')
+        self.other = User.objects.create_user(username='Other')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(text='Текст поста', author=self.user)
+
+    def assertNotModified(self, url, response, client=None):
+        client = client or self.client
+        repeated = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeated.status_code, 304)
+        self.assertIsNone(repeated.context)
+
+    def assertModified(self, url, response, client=None):
+        client = client or self.client
+        repeated = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeated.status_code, 200)
+
+    def test_feeds_not_modified(self):
+        """Неизменённые ленты и пост отдают 304 без рендера шаблона."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:post_detail', args=[self.post.id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+                self.assertIn('Cookie', response['Vary'])
+                self.assertNotModified(url, response)
+                modified = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(modified.status_code, 304)
+
+    def test_validators_change(self):
+        """Новый пост, комментарий и удаление меняют валидаторы."""
+        index = reverse('posts:index')
+        detail = reverse('posts:post_detail', args=[self.post.id])
+        response = self.client.get(index)
+        Post.objects.create(text='Новый пост', author=self.other)
+        self.assertModified(index, response)
+        response = self.client.get(detail)
+        comment = Comment.objects.create(
+            post=self.post, author=self.other, text='Комментарий')
+        self.assertModified(detail, response)
+        response = self.client.get(detail)
+        comment.delete()
+        self.assertModified(detail, response)
+        response = self.client.get(index)
+        Post.objects.filter(author=self.other).delete()
+        self.assertModified(index, response)
+
+    def test_validators_vary_by_user(self):
+        """ETag одного пользователя не подходит другому."""
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        other_client = Client()
+        other_client.force_login(self.other)
+        self.assertModified(url, response, other_client)
+        self.assertModified(url, response, Client())
+
+
+@override_settings(COMMENTS_PAGE_SIZE=20)
+class CommentsPaginationTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='Author')
+        self.post = Post.objects.create(text='Текст поста', author=self.author)
+        for i in range(25):
+            Comment.objects.create(
+                post=self.post,
+                author=User.objects.create_user(username=f'reader{i}'),
+                text=f'Комментарий {i}',
+            )
+
+    def test_first_comments_capped(self):
+        """На странице поста только первые комментарии и «Показать ещё»."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.id]))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertContains(response, 'Показать ещё комментарии')
+
+    def test_load_more_fragment(self):
+        """Фрагмент отдаёт следующую порцию одним запросом."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.id]))
+        url = reverse('posts:post_comments', args=[self.post.id])
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, {'cursor': response.context['comments'].next_cursor})
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [f'Комментарий {i}' for i in range(20, 25)],
+        )
+        self.assertNotContains(response, 'Показать ещё комментарии')
+        self.assertNotContains(response, '<html')
+
+    def test_comments_of_missing_post(self):
+        """Фрагмент комментариев несуществующего поста — 404."""
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.id + 1000]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_title_is_plain_text(self):
+        """В заголовок страницы поста не попадает скрипт."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.id]))
+        title = response.content.decode().split('<title>')[1].split(
+            '</title>')[0]
+        self.assertNotIn('<script', title)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Searcher')
+        self.client.force_login(self.user)
+        self.cat = Post.objects.create(
+            text='Кот спит на диване, кот мурчит', author=self.user)
+        self.dog = Post.objects.create(
+            text='Собака и кот гуляют', author=self.user)
+        Post.objects.create(text='Про погоду', author=self.user)
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params})
+        return response.context['page_obj']
+
+    def test_search_ranked(self):
+        """Поиск находит посты по словам и ставит выше релевантные."""
+        self.assertEqual(list(self.search('КОТ')), [self.cat, self.dog])
+        self.assertEqual(list(self.search('собака кот')), [self.dog])
+        self.assertEqual(list(self.search('"кот" OR NEAR(')), [])
+
+    def test_search_without_words(self):
+        """Запрос из одних кавычек и звёздочек ничего не находит."""
+        for query in ('""', '*', '" * "', '-', '^кот*'):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    reverse('posts:search'), {'q': query})
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.search('""')), [])
+        self.assertEqual(list(self.search('*')), [])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        self.dog.text = 'Собака гуляет одна'
+        self.dog.save()
+        self.assertEqual(list(self.search('кот')), [self.cat])
+        self.cat.delete()
+        self.assertEqual(list(self.search('кот')), [])
+
+    def test_search_cursor_pagination(self):
+        """Выдача листается курсором, запрос сохраняется в ссылках."""
+        for i in range(12):
+            Post.objects.create(text=f'Кот номер {i}', author=self.user)
+        page = self.search('кот')
+        self.assertEqual(len(page), 10)
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'кот', 'cursor': page.next_cursor})
+        self.assertContains(response, 'q=%D0%BA%D0%BE%D1%82&amp;cursor=')
+        second = response.context['page_obj']
+        self.assertEqual(len(second), 4)
+        self.assertFalse(set(page) & set(second))
+
+    def test_rebuild_search_index(self):
+        """Команда rebuild_search_index пересобирает индекс."""
+        search.get_backend().clear()
+        self.assertEqual(list(self.search('кот')), [])
+        call_command(
+            'rebuild_search_index', chunk_size=1, stdout=StringIO())
+        self.assertEqual(list(self.search('кот')), [self.cat, self.dog])
+
+    def test_admin_search(self):
+        """Поиск в админке идёт через индекс."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собака'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.dog])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Replicated')
+        self.author = User.objects.create_user(username='ReplicaAuthor')
+        self.client.force_login(self.user)
+        self.old = Post.objects.create(text='Старый пост', author=self.author)
+        # Реплика — копия базы на этот момент: дальше она «отстаёт».
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'replica.sqlite3')
+        connection.ensure_connection()
+        # Дамп через то же соединение видит данные открытой транзакции
+        # теста, в отличие от backup(). Поисковый индекс (виртуальная
+        # таблица FTS5) iterdump восстановить не умеет, а лентам он не нужен.
+        replica = sqlite3.connect(path)
+        replica.executescript('\n'.join(
+            line for line in connection.connection.iterdump()
+            if 'posts_post_fts' not in line))
+        replica.close()
+        connections.databases['replica'] = {
+            **connection.settings_dict, 'NAME': path}
+        self.new = Post.objects.create(text='Новый пост', author=self.author)
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections.databases['replica']
+        del connections._connections.replica
+        self.directory.cleanup()
+
+    def feed(self):
+        return list(self.client.get(reverse('posts:index')).context[
+            'page_obj'])
+
+    def test_reads_from_replica(self):
+        """Ленты читаются с реплики, запись идёт в основную базу."""
+        self.assertEqual(self.feed(), [self.old])
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.new.id]))
+        self.assertEqual(response.status_code, 404)
+        self.client.post(
+            reverse('posts:add_comment', args=[self.old.id]),
+            {'text': 'Комментарий'})
+        self.assertTrue(Comment.objects.using('default').exists())
+        self.assertFalse(Comment.objects.using('replica').exists())
+
+    def test_read_your_writes(self):
+        """После записи клиент закреплён за основной базой."""
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Свой пост'})
+        self.assertIn('db_pinned', response.cookies)
+        self.assertEqual(self.feed()[0].text, 'Свой пост')
+        other = Client()
+        other.force_login(self.author)
+        response = other.get(reverse('posts:index'))
+        self.assertEqual(list(response.context['page_obj']), [self.old])
+
+    def test_get_write_pins(self):
+        """Запись в GET-view (подписка) тоже закрепляет клиента."""
+        response = self.client.get(
+            reverse('posts:profile_follow', args=[self.author.username]))
+        self.assertIn('db_pinned', response.cookies)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [self.new, self.old])
+
+    def test_replica_fragment_not_served_to_writer(self):
+        """Фрагмент, собранный с реплики, не достаётся автору записи."""
+        self.client.post(reverse('posts:post_create'), {'text': 'Свой пост'})
+        # Незакреплённый читатель кеширует отстающую ленту под новым
+        # поколением.
+        other = Client()
+        other.force_login(self.author)
+        self.assertNotContains(other.get(reverse('posts:index')), 'Свой пост')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Свой пост')
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_pin_expires(self):
+        """Закрепление действует DATABASE_REPLICA_PIN_SECONDS."""
+        self.client.post(reverse('posts:post_create'), {'text': 'Свой пост'})
+        with override_settings(DATABASE_REPLICA_PIN_SECONDS=-1):
+            self.assertEqual(self.feed(), [self.old])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ExportTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Exporter')
+        self.group = Group.objects.create(
+            title='Группа', description='Описание', slug='export-slug')
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост, «{i}»', author=self.user, group=self.group)
+            for i in range(3)
+        ]
+        self.posts[0].image = SimpleUploadedFile(
+            'export.png', get_image_content(), content_type='image/png')
+        self.posts[0].save()
+        self.client.force_login(self.user)
+
+    def get(self, name, **params):
+        kwargs = (
+            {'slug': self.group.slug} if name == 'group_export'
+            else {'username': self.user.username})
+        response = self.client.get(
+            reverse(f'posts:{name}', kwargs=kwargs), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_export_jsonl(self):
+        """Профиль выгружается в JSONL по посту на строку."""
+        response, content = self.get('profile_export')
+        self.assertEqual(
+            response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertIn('Exporter.jsonl', response['Content-Disposition'])
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [record['id'] for record in records],
+            [post.id for post in self.posts])
+        self.assertEqual(records[1]['text'], 'Пост, «1»')
+        self.assertEqual(records[1]['group'], self.group.slug)
+
+    def test_export_csv_gzip(self):
+        """Группа выгружается в CSV, по желанию сжатым gzip на лету."""
+        response, content = self.get('group_export', format='csv', gzip=1)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('export-slug.csv.gz', response['Content-Disposition'])
+        lines = gzip.decompress(content).decode().splitlines()
+        rows = list(csv.DictReader(lines))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[2]['text'], 'Пост, «2»')
+        self.assertEqual(rows[0]['image'], self.posts[0].image.name)
+
+    def test_export_zip_with_images(self):
+        """С images=1 выгрузка и картинки постов собираются в zip."""
+        response, content = self.get('profile_export', images=1)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(
+                archive.namelist(),
+                ['Exporter.jsonl', self.posts[0].image.name])
+            self.assertEqual(
+                archive.read(self.posts[0].image.name),
+                Post.objects.get(id=self.posts[0].id).image.read())
+            self.assertEqual(
+                len(archive.read('Exporter.jsonl').splitlines()), 3)
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            reverse('posts:profile_export', args=[self.user.username]),
+            {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_access(self):
+        """Выгрузка — после входа, картинки — только владельцу и staff."""
+        url = reverse('posts:profile_export', args=[self.user.username])
+        response = Client().get(url)
+        self.assertRedirects(response, f'{reverse("users:login")}?next={url}')
+        self.client.force_login(User.objects.create_user(username='Other'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(
+            self.client.get(url, {'images': 1}).status_code, 403)
+
+    @override_settings(EXPORT_THROTTLE_SECONDS=60)
+    def test_export_throttled(self):
+        """Вторая выгрузка за EXPORT_THROTTLE_SECONDS получает 429."""
+        cache.clear()
+        url = reverse('posts:group_export', args=[self.group.slug])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_export_content_command(self):
+        """Команда export_content пишет ту же выгрузку в файл."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/posts.csv.gz'
+            call_command(
+                'export_content', group=self.group.slug, format='csv',
+                gzip=True, output=path, stderr=StringIO())
+            with gzip.open(path, 'rt') as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual(
+            [int(row['id']) for row in rows], [post.id for post in self.posts])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPipelineTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Photographer')
+        self.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                'photo.png', get_image_content(), content_type='image/png'),
+        )
+
+    def test_placeholder_until_thumbnail_ready(self):
+        """Пока миниатюры нет, лента показывает заглушку."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Картинка обрабатывается')
+        thumbnails.generate(self.post.image.name)
+        thumbnail = thumbnails.get_feed_thumbnail(self.post.image)
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Картинка обрабатывается')
+        self.assertContains(response, thumbnail.url)
+
+    @override_settings(THUMBNAIL_PIPELINE_WORKERS=1)
+    def test_missing_variants_requeued(self):
+        """Картинка без вариантов уходит на генерацию один раз."""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client.get(reverse('posts:index'))
+            thumbnails.prefetch([self.post])
+        schedule.assert_called_once_with(self.post.image.name)
+
+    def test_prefetch_batches_lookups(self):
+        """Миниатюры страницы читаются одним запросом, затем из кеша."""
+        thumbnails.generate(self.post.image.name)
+        Post.objects.create(text='Без картинки', author=self.user)
+        Post.objects.create(
+            text='Ещё картинка', author=self.user, image=self.post.image.name)
+        cache.clear()
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            thumbnails.prefetch(posts)
+        self.assertEqual(
+            [bool(post.feed_image) for post in posts], [True, False, True])
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(0):
+            thumbnails.prefetch(posts)
+        self.assertEqual(posts[0].feed_image.url, posts[2].feed_image.url)
+
+    def test_prefetch_other_kvstore(self):
+        """Незнакомое хранилище sorl читается его публичным get()."""
+        thumbnails.generate(self.post.image.name)
+        with mock.patch.object(
+                thumbnails, 'uses_cached_db_kvstore', return_value=False):
+            thumbnails.prefetch([self.post])
+        self.assertEqual(
+            self.post.feed_image.url,
+            thumbnails.get_feed_thumbnail(self.post.image).url)
+
+    def create_post(self, size):
+        return Post.objects.create(
+            text='Широкая картинка',
+            author=self.user,
+            image=SimpleUploadedFile(
+                'wide.png', get_image_content(size), content_type='image/png'),
+        )
+
+    @override_settings(THUMBNAIL_FEED_WEBP=False)
+    def test_responsive_variants(self):
+        """Лента отдаёт srcset всех ширин с размерами и lazy-загрузкой."""
+        post = self.create_post((1200, 600))
+        thumbnails.generate(post.image.name)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (1200, 600))
+        thumbnails.prefetch([post])
+        image = post.feed_image
+        self.assertEqual(
+            [int(item.split()[1][:-1]) for item in image.srcset.split(', ')],
+            list(settings.THUMBNAIL_FEED_WIDTHS))
+        self.assertEqual((image.width, image.height), (960, 480))
+        self.assertEqual(image.webp_srcset, '')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'srcset="{image.srcset}"')
+        self.assertContains(
+            response, f'sizes="{settings.THUMBNAIL_FEED_SIZES}"')
+        self.assertContains(response, 'width="960" height="480"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertNotContains(response, 'image/webp')
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.id,)))
+        self.assertContains(response, 'loading="eager"')
+
+    def test_narrow_source_not_upscaled(self):
+        """Узкий исходник даёт один вариант в свою ширину."""
+        thumbnails.generate(self.post.image.name)
+        thumbnails.prefetch([self.post])
+        image = self.post.feed_image
+        self.assertEqual(image.srcset, f'{image.url} 50w')
+        self.assertEqual((image.width, image.height), (50, 50))
+
+    def test_missing_dimensions(self):
+        """Без сохранённых размеров width и height берутся из варианта."""
+        post = self.create_post((1000, 250))
+        thumbnails.generate(post.image.name)
+        Post.objects.filter(id=post.id).update(
+            image_width=None, image_height=None)
+        post.refresh_from_db()
+        thumbnails.prefetch([post])
+        self.assertEqual(
+            (post.feed_image.width, post.feed_image.height), (960, 240))
+
+    @skipUnless(features.check('webp'), 'Pillow собран без WebP')
+    @override_settings(THUMBNAIL_FEED_WEBP=True)
+    def test_webp_variants(self):
+        """С поддержкой WebP в <picture> есть и WebP-варианты."""
+        post = self.create_post((700, 350))
+        thumbnails.generate(post.image.name)
+        thumbnails.prefetch([post])
+        self.assertIn('.webp 480w', post.feed_image.webp_srcset)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'type="image/webp"')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Reposter')
+        self.storage = Post._meta.get_field('image').storage
+        self.content = get_image_content()
+
+    def create_post(self, name='meme.png'):
+        return Post.objects.create(
+            text='Мем',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name, self.content, content_type='image/png'),
+        )
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые загрузки — один файл, две ссылки, одни миниатюры."""
+        first = self.create_post('meme.png')
+        second = self.create_post('repost.PNG')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.endswith('.png'))
+        self.assertEqual(
+            MediaFile.objects.get(name=first.image.name).refs, 2)
+        thumbnails.generate(first.image.name)
+        self.assertEqual(
+            thumbnails.get_feed_thumbnail(second.image).url,
+            thumbnails.get_feed_thumbnail(first.image).url)
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл и миниатюры удаляются только с последней ссылкой."""
+        name = self.create_post().image.name
+        self.create_post()
+        thumbnails.generate(name)
+        source = thumbnails.source_file(name)
+        thumbnail = thumbnails.get_feed_thumbnail(source)
+        thumbnails.release(name)
+        self.assertTrue(self.storage.exists(name))
+        thumbnails.release(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(thumbnail.exists())
+        self.assertIsNone(thumbnails.get_feed_thumbnail(source))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    def test_untracked_file_kept(self):
+        """Файл без учёта ссылок release() не удаляет."""
+        self.storage.delete('posts/legacy.png')
+        FileSystemStorage._save(
+            self.storage, 'posts/legacy.png', ContentFile(self.content))
+        self.assertFalse(self.storage.release('posts/legacy.png'))
+        self.assertTrue(self.storage.exists('posts/legacy.png'))
+
+    def test_imported_posts_take_references(self):
+        """Посты из import_content берут ссылки на уже загруженный файл."""
+        name = self.create_post().image.name
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'content.jsonl')
+            with open(path, 'w', encoding='utf-8') as file:
+                record = {'type': 'post', 'text': 'Копия', 'image': name,
+                          'author': self.user.username}
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            call_command('import_content', path, stdout=StringIO())
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 2)
+        # Удаление импортированного поста снимает только его ссылку.
+        thumbnails.release(name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 1)
+
+    def test_dedupe_media(self):
+        """dedupe_media склеивает старые файлы и пересчитывает ссылки."""
+        for name in ('posts/old.png', 'posts/copy.png'):
+            self.storage.delete(name)
+            FileSystemStorage._save(self.storage, name, ContentFile(
+                self.content))
+            Post.objects.create(text=name, author=self.user, image=name)
+        Post.objects.create(
+            text='Пропавший', author=self.user, image='posts/lost.png')
+        out = StringIO()
+        call_command('dedupe_media', workers=0, stdout=out)
+        names = set(Post.objects.exclude(
+            image='posts/lost.png').values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 2)
+        self.assertTrue(self.storage.exists(name))
+        self.assertFalse(self.storage.exists('posts/old.png'))
+        self.assertFalse(self.storage.exists('posts/copy.png'))
+        self.assertIsNotNone(
+            thumbnails.get_feed_thumbnail(thumbnails.source_file(name)))
+        self.assertIn('Перенесено картинок: 2', out.getvalue())
+        self.assertIn('не найдено: 1', out.getvalue())
+        call_command('dedupe_media', workers=0, stdout=out)
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 2)
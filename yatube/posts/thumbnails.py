@@ -0,0 +1,324 @@
+"""Миниатюры картинок постов.
+
+Миниатюры генерируются заранее — в фоновом пуле потоков после сохранения
+поста или командой warm_thumbnails, — а шаблоны только читают готовые
+из key-value хранилища sorl-thumbnail и никогда не генерируют их сами.
+
+Для ленты это набор ширин THUMBNAIL_FEED_WIDTHS — в JPEG и, если Pillow
+умеет, в WebP — для srcset: браузер сам берёт вариант под экран.
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from core.cache import generations
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, cache, caches
+from django.db import close_old_connections, connection, transaction
+from PIL import features
+from sorl import __version__ as sorl_version
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import images
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+FEED_OPTIONS = {'upscale': False}
+REQUEUE_KEY = 'thumbnails:requeued:{}'
+# Старшие версии sorl, чей формат cached_db хранилища проверен.
+SORL_CACHED_DB_VERSIONS = ('12',)
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    """Бэкенд sorl, который умеет искать миниатюру без генерации."""
+
+    def get_options(self, source, options):
+        """Дополняет options так же, как это делает get_thumbnail."""
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def get_thumbnail_file(self, file_, geometry_string, **options):
+        """ImageFile будущей миниатюры — без обращения к хранилищам."""
+        source = ImageFile(file_)
+        options = self.get_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def create_from(self, source, source_image, geometry_string, **options):
+        """Миниатюра source из уже декодированного source_image.
+
+        Как get_thumbnail, но исходник не открывается заново — так
+        несколько миниатюр делаются за одно декодирование.
+        """
+        options = self.get_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        thumbnail = ImageFile(name, default.storage)
+        if not thumbnail.exists():
+            options['image_info'] = default.engine.get_image_info(
+                source_image)
+            self._create_thumbnail(
+                source_image, geometry_string, options, thumbnail)
+        default.kvstore.set(thumbnail, source)
+        return thumbnail
+
+    def get_cached(self, file_, geometry_string, **options):
+        """Готовая миниатюра из key-value хранилища или None."""
+        thumbnail = self.get_thumbnail_file(file_, geometry_string, **options)
+        return default.kvstore.get(thumbnail)
+
+
+backend = ThumbnailBackend()
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_PIPELINE_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def source_file(name):
+    """ImageFile исходника по имени — в том же хранилище, что у Post.image."""
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def webp_enabled():
+    return settings.THUMBNAIL_FEED_WEBP and features.check('webp')
+
+
+def feed_variants():
+    """(формат, ширина, geometry, options) вариантов ленты.
+
+    Формат None — формат миниатюр sorl по умолчанию (JPEG), он же
+    запасной src для браузеров без WebP.
+    """
+    formats = (None, 'WEBP') if webp_enabled() else (None,)
+    for fmt in formats:
+        options = dict(FEED_OPTIONS)
+        if fmt:
+            options['format'] = fmt
+        for width in settings.THUMBNAIL_FEED_WIDTHS:
+            yield fmt, width, str(width), options
+
+
+def generate(name):
+    """Создаёт варианты ленты и, если включено, WebP-вариант картинки.
+
+    Исходник декодируется один раз на все варианты. Варианты шире
+    исходника не нужны — кроме самого широкого: без увеличения он равен
+    исходнику и всегда есть у готовой картинки.
+    """
+    source = source_file(name)
+    largest = max(settings.THUMBNAIL_FEED_WIDTHS)
+    try:
+        source_image = default.engine.get_image(source)
+        try:
+            width, height = default.engine.get_image_size(source_image)
+            source.set_size((width, height))
+            default.kvstore.get_or_set(source)
+            for _, variant_width, geometry, options in feed_variants():
+                if variant_width >= width and variant_width != largest:
+                    continue
+                backend.create_from(source, source_image, geometry, **options)
+        finally:
+            default.engine.cleanup(source_image)
+        if settings.IMAGE_WEBP_VARIANTS:
+            images.save_webp(name, Post._meta.get_field('image').storage)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру для %s', name)
+        return
+    # Размеры картинок, загруженных мимо формы (импорт, старые посты).
+    Post.objects.filter(image=name, image_width__isnull=True).update(
+        image_width=width, image_height=height)
+    # Закешированные фрагменты лент показывают заглушку — сбрасываем их.
+    posts = Post.objects.filter(image=name)
+    for author_id, group_id in posts.values_list('author_id', 'group_id'):
+        generations.bump('index', f'profile:{author_id}', f'group:{group_id}')
+
+
+def generate_in_worker(name):
+    """generate() для потоков и процессов пула — со своим соединением."""
+    close_old_connections()
+    try:
+        generate(name)
+    finally:
+        connection.close()
+
+
+def schedule(name):
+    """Ставит генерацию в фоновый пул; без воркеров — делает сразу."""
+    if settings.THUMBNAIL_PIPELINE_WORKERS:
+        get_executor().submit(generate_in_worker, name)
+    else:
+        generate(name)
+
+
+def schedule_on_commit(name):
+    transaction.on_commit(lambda: schedule(name))
+
+
+def requeue(names):
+    """Ставит в фоновый пул картинки, которым лента не нашла вариантов.
+
+    Так догоняются картинки с миниатюрами старого формата и упавшие
+    генерации. Без пула ничего не делает: генерировать в запросе ленты
+    нельзя, остаётся warm_thumbnails.
+    """
+    if not settings.THUMBNAIL_PIPELINE_WORKERS:
+        return
+    for name in names:
+        # Одна постановка на картинку, сколько бы лент её ни показали.
+        if cache.add(REQUEUE_KEY.format(name), True,
+                     settings.THUMBNAIL_REQUEUE_TIMEOUT):
+            schedule(name)
+
+
+def release(name):
+    """Снимает ссылку поста на картинку; с последней — и её миниатюры."""
+    storage = Post._meta.get_field('image').storage
+    if storage.release(name):
+        default.kvstore.delete(source_file(name))
+        storage.delete(images.webp_name(name))
+
+
+def release_on_commit(name):
+    transaction.on_commit(lambda: release(name))
+
+
+def get_feed_thumbnail(image):
+    """Самый широкий готовый вариант ленты или None, если его ещё нет."""
+    if not image:
+        return None
+    return backend.get_cached(
+        image, str(max(settings.THUMBNAIL_FEED_WIDTHS)), **FEED_OPTIONS)
+
+
+def uses_cached_db_kvstore():
+    """Хранилище sorl — cached_db той версии, чей формат читает get_many.
+
+    Подклассы и другие версии sorl могут хранить иначе — для них только
+    публичный kvstore.get().
+    """
+    # default.kvstore — LazyObject: __class__ он отдаёт от обёрнутого.
+    return (
+        default.kvstore.__class__ is cached_db_kvstore.KVStore
+        and sorl_version.split('.')[0] in SORL_CACHED_DB_VERSIONS
+    )
+
+
+def get_many(thumbnails):
+    """Готовые миниатюры пачкой: ключ kvstore → ImageFile или None.
+
+    cached_db хранилище читается так же, как его читает sorl, но пачкой:
+    один get_many к кешу THUMBNAIL_CACHE и один запрос к модели KVStore
+    на промахи. Остальные хранилища — kvstore.get() по одной.
+    """
+    thumbnails = {add_prefix(thumbnail.key): thumbnail
+                  for thumbnail in thumbnails}
+    if not uses_cached_db_kvstore():
+        return {key: default.kvstore.get(thumbnail)
+                for key, thumbnail in thumbnails.items()}
+    try:
+        kv_cache = caches[sorl_settings.THUMBNAIL_CACHE]
+    except InvalidCacheBackendError:
+        kv_cache = cache
+    empty = cached_db_kvstore.EMPTY_VALUE
+    found = kv_cache.get_many(list(thumbnails))
+    missing = [key for key in thumbnails if key not in found]
+    if missing:
+        from_db = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        # Промахи кешируются, как у sorl, — пустым значением.
+        fetched = {key: from_db.get(key, empty) for key in missing}
+        kv_cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(fetched)
+    return {
+        key: None if value == empty else deserialize_image_file(value)
+        for key, value in found.items()
+    }
+
+
+def srcset(thumbnails):
+    """srcset из вариантов; одинаковые по ширине (узкий исходник) — один."""
+    by_width = {thumbnail.width: thumbnail for thumbnail in thumbnails}
+    return ', '.join(
+        f'{by_width[width].url} {width}w' for width in sorted(by_width))
+
+
+class FeedImage:
+    """Готовые варианты картинки поста для <picture>.
+
+    width и height — размер самого широкого варианта: по сохранённым
+    размерам картинки, а без них — по самому варианту.
+    """
+
+    def __init__(self, post, variants):
+        fallback = sorted(variants[None], key=lambda image: image.width)
+        self.src = fallback[-1]
+        self.srcset = srcset(fallback)
+        self.webp_srcset = srcset(variants.get('WEBP', ()))
+        self.sizes = settings.THUMBNAIL_FEED_SIZES
+        if post.image_width and post.image_height:
+            self.width = min(
+                post.image_width, max(settings.THUMBNAIL_FEED_WIDTHS))
+            self.height = round(
+                self.width * post.image_height / post.image_width)
+        else:
+            self.width, self.height = self.src.width, self.src.height
+
+    @property
+    def url(self):
+        return self.src.url
+
+
+def prefetch(posts):
+    """Проставляет post.feed_image всем постам разом, без запроса на пост.
+
+    post.feed_image — FeedImage или None, пока варианты не созданы;
+    такие картинки уходят на генерацию (requeue).
+    """
+    keys = {}
+    thumbnails = []
+    for post in posts:
+        post.feed_image = None
+        if post.image:
+            for fmt, _, geometry, options in feed_variants():
+                thumbnail = backend.get_thumbnail_file(
+                    post.image, geometry, **options)
+                keys[post, fmt, geometry] = add_prefix(thumbnail.key)
+                thumbnails.append(thumbnail)
+    if not keys:
+        return
+    found = get_many(thumbnails)
+    variants = defaultdict(lambda: defaultdict(list))
+    for (post, fmt, _), key in keys.items():
+        if found.get(key):
+            variants[post][fmt].append(found[key])
+    for post, found in variants.items():
+        if found[None]:
+            post.feed_image = FeedImage(post, found)
+    requeue({
+        post.image.name for post in posts
+        if post.image and post.feed_image is None
+    })
@@ -0,0 +1,222 @@
+"""Материализованная лента подписок.
+
+Новый пост раскладывается по лентам подписчиков при записи (fan-out on
+write). Для авторов, у которых подписчиков больше TIMELINE_FANOUT_LIMIT,
+раскладка не делается: их посты подмешиваются в ленту при чтении
+(fan-out on read). Когда автор опускается ниже лимита, его посты
+раскладываются подписчикам задним числом.
+"""
+from collections import defaultdict
+
+from core import background
+from core.cache import generations
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+
+def is_celebrity(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+def celebrity_authors(user):
+    """Авторы из подписок user, чьи посты читаются без раскладки."""
+    return Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values_list('author_id', flat=True)
+
+
+def _insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    )
+
+
+def fan_out_many(posts):
+    """fan_out для пачки постов: один запрос подписчиков на всю пачку."""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    celebrities = UserStats.objects.filter(
+        user_id__in=list(by_author),
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values_list('user_id', flat=True)
+    followers = Follow.objects.filter(
+        author_id__in=set(by_author) - set(celebrities)
+    ).values_list('author_id', 'user_id')
+    _insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=author_id,
+            pub_date=post.pub_date,
+        )
+        for author_id, user_id in followers.iterator()
+        for post in by_author[author_id]
+    )
+
+
+def add_author(user_id, author_id):
+    """После подписки добавляет в ленту последние посты автора."""
+    generations.bump(f'follow:{user_id}')
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).order_by('-pub_date', '-id').values_list('id', 'pub_date')
+    _insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts[:settings.TIMELINE_BACKFILL]
+    )
+
+
+def add_authors(pairs):
+    """add_author для пачки подписок (user_id, author_id).
+
+    Звёзды отсеиваются одним запросом, последние посты читаются по разу
+    на автора, а не на подписку.
+    """
+    readers = defaultdict(set)
+    for user_id, author_id in pairs:
+        readers[author_id].add(user_id)
+    generations.bump(*{f'follow:{user_id}' for user_id, _ in pairs})
+    celebrities = set(UserStats.objects.filter(
+        user_id__in=list(readers),
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values_list('user_id', flat=True))
+    entries = []
+    for author_id in readers.keys() - celebrities:
+        posts = Post.objects.filter(
+            author_id=author_id
+        ).order_by('-pub_date', '-id').values_list('id', 'pub_date')
+        entries.extend(
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts[:settings.TIMELINE_BACKFILL]
+            for user_id in readers[author_id]
+        )
+    _insert(entries)
+
+
+def remove_author(user_id, author_id):
+    generations.bump(f'follow:{user_id}')
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    # Счётчики подключены раньше: followers_count уже без этой подписки.
+    if UserStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists():
+        transaction.on_commit(
+            lambda: background.submit(backfill_followers, author_id))
+
+
+def backfill_followers(author_id):
+    """Раскладывает последние посты автора по лентам всех подписчиков.
+
+    Нужна, когда автор перестал быть звездой: посты, написанные без
+    раскладки, иначе пропали бы из лент.
+    """
+    posts = list(Post.objects.filter(
+        author_id=author_id
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'pub_date')[:settings.TIMELINE_BACKFILL])
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    _insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in followers.iterator()
+        for post_id, pub_date in posts
+    )
+    generations.bump('index')
+
+
+def rebuild(user):
+    """Пересобирает ленту user с нуля по текущим подпискам."""
+    generations.bump(f'follow:{user.id}')
+    TimelineEntry.objects.filter(user=user).delete()
+    celebrities = set(celebrity_authors(user))
+    authors = Follow.objects.filter(user=user).exclude(
+        author_id__in=celebrities
+    ).values_list('author_id', flat=True)
+    posts = Post.objects.filter(
+        author_id__in=list(authors)
+    ).values_list('id', 'author_id', 'pub_date')
+    _insert(
+        TimelineEntry(
+            user_id=user.id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for post_id, author_id, pub_date in posts.iterator()
+    )
+
+
+def entry_posts(entries):
+    """Посты записей ленты в том же порядке — одним запросом по ключу."""
+    posts = Post.objects.for_feed().in_bulk(
+        [entry.post_id for entry in entries])
+    return [
+        posts[entry.post_id] for entry in entries if entry.post_id in posts]
+
+
+def follow_feed(user):
+    """Лента подписок: (записи, параметры CursorPaginator).
+
+    Без авторов-звёзд лента листается по самой TimelineEntry в порядке
+    её индекса (user, -pub_date, -post), а посты страницы выбираются
+    потом по ключу. Со звёздами их посты подмешиваются к разложенным
+    одним запросом к постам.
+    """
+    celebrities = list(celebrity_authors(user))
+    if not celebrities:
+        entries = TimelineEntry.objects.filter(user=user).only(
+            'post', 'pub_date')
+        return entries, {
+            'ordering': ('-pub_date', '-post_id'),
+            'transform': entry_posts,
+        }
+    materialized = TimelineEntry.objects.filter(user=user).values('post_id')
+    posts = Post.objects.for_feed().filter(
+        Q(pk__in=materialized) | Q(author_id__in=celebrities))
+    return posts, {}
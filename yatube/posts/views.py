@@ -1,42 +1,84 @@
+from core.cache import fragments
+from core.cache.generations import page_cache_key
+from core.db.routers import replica_reads
+from core.paginator import CursorPaginator, paginate
+from core.profiling import query_budget
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.http import urlencode
+from django.views.decorators.vary import vary_on_cookie
 
+from . import conditional, export, search, timeline
 from .forms import CommentForm, PostForm
-from .models import Group, Post, User, Follow
+from .models import Comment, Follow, Group, Post, User
 
+EXPORT_THROTTLE_KEY = 'export:throttle:{}'
 
+
+@query_budget(6)
+@replica_reads
+@vary_on_cookie
+@conditional.index
 def index(request):
-    posts = Post.objects.all()
-    paginator = Paginator(posts, settings.PAGE_SIZE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    cache_key = page_cache_key(request, 'index', ('index', 'groups'))
+    page_obj = None
+    # Готовый фрагмент — страницу не выбираем.
+    if fragments.get(request, 'index', cache_key) is None:
+        page_obj = paginate(
+            request, Post.objects.for_feed(), count_key='index',
+            count_generations=('index',))
     context = {
         'page_obj': page_obj,
+        'cache_key': cache_key,
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(7)
+@replica_reads
+@vary_on_cookie
+@conditional.group_posts
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, settings.PAGE_SIZE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    cache_key = page_cache_key(
+        request, f'group:{group.id}', (f'group:{group.id}', 'groups'))
+    page_obj = None
+    if fragments.get(request, 'group', cache_key) is None:
+        page_obj = paginate(
+            request,
+            Post.objects.for_feed().filter(group=group),
+            count_key=f'group:{group.id}',
+            count_generations=(f'group:{group.id}',),
+        )
     context = {
         'group': group,
         'page_obj': page_obj,
+        'cache_key': cache_key,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(7)
+@replica_reads
+@vary_on_cookie
+@conditional.profile
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    paginator = Paginator(posts, settings.PAGE_SIZE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    cache_key = page_cache_key(
+        request, f'profile:{author.id}', (f'profile:{author.id}', 'groups'))
+    page_obj = None
+    if fragments.get(request, 'profile', cache_key) is None:
+        # Без строки счётчиков (bulk_create, loaddata) считает пагинатор.
+        stats = getattr(author, 'stats', None)
+        page_obj = paginate(
+            request, Post.objects.for_feed().filter(author=author),
+            count=stats.posts_count if stats else None)
     following = False
     if request.user.is_authenticated:
         following = Follow.objects.filter(
@@ -47,13 +89,96 @@ def profile(request, username):
         'page_obj': page_obj,
         'author': author,
         'following': following,
+        'cache_key': cache_key,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def export_response(request, posts, name, owner=False):
+    """Потоковая выгрузка постов: ?format=jsonl|csv, ?gzip=1, ?images=1.
+
+    Картинки (zip) — только владельцу и staff. Не staff начинает не
+    больше одной выгрузки за EXPORT_THROTTLE_SECONDS, иначе — 429.
+    """
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in export.FORMATS:
+        raise Http404('Неизвестный формат выгрузки.')
+    images = bool(request.GET.get('images'))
+    if images and not (owner or request.user.is_staff):
+        raise PermissionDenied
+    throttle = settings.EXPORT_THROTTLE_SECONDS
+    if throttle and not request.user.is_staff and not cache.add(
+            EXPORT_THROTTLE_KEY.format(request.user.id), True, throttle):
+        response = HttpResponse(
+            'Выгрузка уже запрошена, повторите позже.', status=429)
+        response['Retry-After'] = throttle
+        return response
+    compress = bool(request.GET.get('gzip'))
+    chunks, filename = export.export(
+        posts, fmt, compress=compress, images=images,
+        storage=Post._meta.get_field('image').storage, name=name)
+    if images:
+        content_type = 'application/zip'
+    elif compress:
+        content_type = 'application/gzip'
+    else:
+        content_type = f'{export.FORMATS[fmt]}; charset=utf-8'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Бюджет считает только запросы до начала потока — сессию, пользователя
+# и автора или группу: посты выгрузка читает пачками уже после того, как
+# middleware закрыл профиль запроса.
+@query_budget(3)
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    return export_response(
+        request, Post.objects.filter(author=author), author.username,
+        owner=request.user == author)
+
+
+@query_budget(3)
+@login_required
+def group_export(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return export_response(
+        request, Post.objects.filter(group=group), group.slug)
+
+
+@query_budget(4)
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        posts = search.search(Post.objects.for_feed(), query)
+        page_obj = paginate(request, posts, ordering=('search_rank', 'id'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def comments_page(post_id, cursor=None):
+    """Порция комментариев поста по курсору, с авторами одним JOIN."""
+    comments = Comment.objects.filter(post_id=post_id).select_related('author')
+    paginator = CursorPaginator(
+        comments, settings.COMMENTS_PAGE_SIZE, ordering=('created', 'id'))
+    return paginator.get_cursor_page(cursor)
+
+
+@query_budget(6)
+@replica_reads
+@vary_on_cookie
+@conditional.post_detail
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    comments = comments_page(post.id)
     form = CommentForm()
     context = {
         'post': post,
@@ -63,6 +188,23 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+# Порция комментариев и, если она пуста, проверка, что пост есть.
+@query_budget(2)
+@replica_reads
+def post_comments(request, post_id):
+    """Следующая порция комментариев — HTML-фрагмент для «Показать ещё»."""
+    comments = comments_page(post_id, request.GET.get('cursor'))
+    if not comments:
+        # Пустая порция — возможно, поста нет; иначе хватает одного запроса.
+        get_object_or_404(Post, id=post_id)
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+@query_budget(11)
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -74,6 +216,7 @@ def post_create(request):
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@query_budget(10)
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -91,6 +234,7 @@ def post_edit(request, post_id):
         'post': post, 'form': form, 'is_edit': True})
 
 
+@query_budget(6)
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -103,32 +247,52 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(6)
+@replica_reads
 @login_required
 def follow_index(request):
-    posts_list = Post.objects.filter(
-        author__following__user=request.user)
-    paginator = Paginator(posts_list, settings.PAGE_SIZE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {'page_obj': page_obj}
+    user_id = request.user.id
+    cache_key = page_cache_key(
+        request, f'follow:{user_id}', ('index', 'groups', f'follow:{user_id}'))
+    page_obj = None
+    if fragments.get(request, 'follow', cache_key) is None:
+        feed, options = timeline.follow_feed(request.user)
+        page_obj = paginate(
+            request,
+            feed,
+            count_key=f'follow:{user_id}',
+            count_generations=('index', f'follow:{user_id}'),
+            **options,
+        )
+    context = {
+        'page_obj': page_obj,
+        'cache_key': cache_key,
+    }
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(11)
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     user = request.user
     if author != user:
-        Follow.objects.get_or_create(user=user, author=author)
+        # Один INSERT; повтор упирается в unique_follow и игнорируется.
+        # В отличие от bulk_create(ignore_conflicts=True) так срабатывают
+        # сигналы ленты и счётчиков — только если запись правда создана.
+        try:
+            with transaction.atomic():
+                Follow.objects.create(user=user, author=author)
+        except IntegrityError:
+            pass
     return redirect('posts:profile', username=username)
 
 
+@query_budget(8)
 @login_required
 def profile_unfollow(request, username):
-    user_follower = get_object_or_404(
-        Follow,
+    Follow.objects.filter(
         user=request.user,
         author__username=username
-    )
-    user_follower.delete()
+    ).delete()
     return redirect('posts:profile', username=username)
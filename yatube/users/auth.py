@@ -0,0 +1,39 @@
+"""request.user без запроса к auth_user на каждый запрос.
+
+Пользователь кешируется по id. Перед выдачей из кеша сверяется хеш
+авторизации сессии — как в django.contrib.auth.get_user, поэтому смена
+пароля разлогинивает старые сессии и с кешем. Запись пользователя
+сбрасывает кеш (users.signals).
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+KEY = 'auth:user:{}'
+
+
+def get_user(request):
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    session_hash = session.get(HASH_SESSION_KEY)
+    if user_id is None or not session_hash:
+        return auth.get_user(request)
+    key = KEY.format(user_id)
+    user = cache.get(key)
+    backends = settings.AUTHENTICATION_BACKENDS
+    if (
+        user is not None
+        and session.get(BACKEND_SESSION_KEY) in backends
+        and constant_time_compare(session_hash, user.get_session_auth_hash())
+    ):
+        return user
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate(user_id):
+    cache.delete(KEY.format(user_id))
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+User = get_user_model()
+
+
+class CachedUserTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='Cached', password='old-password')
+        self.client.force_login(self.user)
+        self.url = reverse('about:author')
+        self.client.get(self.url)
+
+    def test_user_from_cache(self):
+        """Сессия и пользователь запроса читаются из кеша."""
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_invalidated_on_save(self):
+        """Запись пользователя сбрасывает его кеш."""
+        self.user.username = 'Renamed'
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Пользователь: Renamed')
+
+    def test_password_change_logs_out(self):
+        """Смена пароля разлогинивает старые сессии и с кешем."""
+        self.user.set_password('new-password')
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertFalse(response.context['user'].is_authenticated)
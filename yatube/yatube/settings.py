@@ -50,11 +50,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,7 +67,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.profiling.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,13 +87,34 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# core.db.backends.sqlite3 включает WAL и прагмы (core/db/backends/sqlite3);
+# соединения живут CONN_MAX_AGE секунд и проверяются перед запросом.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
+# Алиасы DATABASES, с которых читают view под core.db.routers.replica_reads.
+# Для локальной проверки хватит копии базы:
+#   DATABASES['replica'] = {
+#       **DATABASES['default'],
+#       'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+#       'TEST': {'MIRROR': 'default'},
+#   }
+#   DATABASE_REPLICAS = ['replica']
+DATABASE_REPLICAS = []
+# Сколько секунд после записи клиент читает только с основной базы.
+DATABASE_REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -133,6 +156,13 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+
+# Имена с хешем содержимого и .gz/.br рядом (core.staticfiles); сжимает
+# collectstatic в STATICFILES_COMPRESS_WORKERS процессах (None — по ядрам).
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+STATICFILES_COMPRESS_WORKERS = None
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -148,8 +178,96 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кто отдаёт байты медиа (core.media): 'x-accel-redirect' — nginx из
+# internal-location MEDIA_ACCEL_REDIRECT_PREFIX, 'x-sendfile' — Apache или
+# lighttpd по пути файла, None — сам Django через FileResponse.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Каталоги MEDIA_ROOT, открытые всем; остальное видят только staff.
+MEDIA_PUBLIC_PREFIXES = ('posts/', 'cache/')
+# Файлы с хешем в имени кешируются на год, остальные — на столько секунд.
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
+# Загрузки пишутся во временный файл на диске, а не в память воркера.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Картинки постов при загрузке (posts.images): больше IMAGE_MAX_SIDE по
+# длинной стороне ужимаются, больше остальных пределов — отклоняются.
+IMAGE_MAX_SIDE = 2048
+IMAGE_MAX_PIXELS = 50 * 10 ** 6
+IMAGE_MAX_UPLOAD_SIZE = 20 * 2 ** 20
+# Класть ли рядом с картинкой WebP-вариант (если Pillow собран с WebP).
+IMAGE_WEBP_VARIANTS = False
+
+# LRU в памяти воркера перед общим для всех воркеров SQLite-файлом; об
+# изменениях воркеры узнают из журнала инвалидаций (core.cache.backends).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.backends.tiered.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'LOCAL_MAX_ENTRIES': 5000,
+            'LOCAL_MAX_SIZE': 32 * 1024 * 1024,
+            'LOCAL_TIMEOUT': 60,
+            'LOCAL_EXCLUDE': ('metrics:',),
+            'POLL_INTERVAL': 0.1,
+        },
     }
 }
+
+# Посты авторов, у которых подписчиков больше лимита, не раскладываются
+# по лентам при записи, а подмешиваются в ленту подписок при чтении.
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BACKFILL = 1000
+TIMELINE_BATCH_SIZE = 500
+
+# Фрагменты лент версионированы поколениями (core.cache.generations),
+# поэтому срок жизни ограничивает только объём кеша, а не свежесть.
+FRAGMENT_CACHE_TIMEOUT = 60 * 15
+
+# Адреса, с которых доступен /metrics/.
+INTERNAL_IPS = ['127.0.0.1']
+
+# Сессии и пользователь запроса читаются из кеша, в БД — только промахи.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# Сколько секунд пользователь запроса живёт в кеше (users.auth).
+USER_CACHE_TIMEOUT = 60 * 60
+
+# Потоки фоновой генерации миниатюр; 0 — генерировать сразу при сохранении.
+THUMBNAIL_PIPELINE_WORKERS = 2
+# Картинку без готовых вариантов (старые миниатюры, сбой генерации) лента
+# ставит в пул заново, но не чаще раза за столько секунд.
+THUMBNAIL_REQUEUE_TIMEOUT = 60 * 10
+# Ширины вариантов картинки в ленте (srcset) и ширина картинки на экране
+# (sizes): карточки ленты во всю ширину контейнера Bootstrap.
+THUMBNAIL_FEED_WIDTHS = (320, 480, 640, 960)
+THUMBNAIL_FEED_SIZES = '(min-width: 1200px) 1110px, 100vw'
+# WebP-варианты рядом с JPEG, если Pillow собран с WebP.
+THUMBNAIL_FEED_WEBP = True
+
+# Профиль запросов в Server-Timing и в лог core.profiling.
+PROFILING_ENABLED = DEBUG
+# Бюджет SQL-запросов для view без декоратора query_budget; None — без него.
+PROFILING_QUERY_BUDGET = None
+
+# Потоки для фоновых задач core.background; 0 — выполнять сразу.
+BACKGROUND_WORKERS = 2
+
+# Списки меньше порога пагинатор считает точным COUNT(*) прямо в запросе,
+# большие — берёт из кеша или оценки и пересчитывает в фоне.
+PAGINATOR_EXACT_COUNT_THRESHOLD = 10000
+# Через сколько секунд закешированное число записей пересчитывается.
+PAGINATOR_COUNT_TIMEOUT = 60
+
+# Бэкенд полнотекстового поиска по постам (posts.search.backends).
+SEARCH_BACKEND = 'posts.search.backends.SQLiteFTS5Backend'
+
+# Сколько комментариев показывать сразу и подгружать по «Показать ещё».
+COMMENTS_PAGE_SIZE = 20
+
+# Не чаще одной выгрузки профиля или группы за столько секунд на
+# пользователя; 0 — без ограничения. Staff не ограничен.
+EXPORT_THROTTLE_SECONDS = 60
@@ -0,0 +1,20 @@
+"""Настройки тестов: manage.py test и pytest (см. pytest.ini)."""
+from .settings import *  # noqa: F401, F403
+
+# Общий файл кеша пережил бы прогон и смешал бы тесты с сервером.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Тесты идут с DEBUG = False, а манифест есть только после collectstatic.
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+# Тесты не ждут фоновых потоков и удаляют временный MEDIA_ROOT, пока
+# потоки в него пишут, поэтому пулы выполняют задачи сразу.
+THUMBNAIL_PIPELINE_WORKERS = 0
+BACKGROUND_WORKERS = 0
+
+# Тесты выгружают много раз подряд; ограничение проверяется отдельно.
+EXPORT_THROTTLE_SECONDS = 0
@@ -1,7 +1,10 @@
+import re
+from urllib.parse import urlsplit
+
+from core.views import media, metrics, static
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
@@ -9,13 +12,20 @@ urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics/', metrics, name='metrics'),
 ]
 
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
 handler403 = 'core.views.permission_denied'
 
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
+# Медиа и статику на своём домене (CDN) Django не отдаёт. При DEBUG
+# статику из STATICFILES_DIRS раньше перехватывает runserver.
+for url, view, name in (
+    (settings.MEDIA_URL, media, 'media'),
+    (settings.STATIC_URL, static, 'static'),
+):
+    if not urlsplit(url).netloc:
+        prefix = re.escape(url.lstrip('/'))
+        urlpatterns.append(
+            re_path(rf'^{prefix}(?P<path>.*)$', view, name=name))